@@ -0,0 +1,255 @@
+import argparse, os, json, random, shutil, sys, tempfile, time, platform
+
+import lookml_parser
+
+'''
+Call benchmark with: [python lookml_benchmark.py --views 5000 --explores 1000 --output bench.json]
+1. Generates a synthetic LookML repository of the requested size
+2. Runs each phase of lookml_parser.main() against it and times it separately
+3. Writes the timings (and the generator settings) as JSON so runs can be compared between versions
+'''
+
+PHASES = ['discover', 'parse', 'frames', 'includes', 'index', 'trees', 'write']
+
+TREE_TEMPLATE = '<html><head><title>LookML Tree</title></head><body data-src="treeData.json"></body></html>\n'
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--views', help='number of sql table views', type=int, default=1000)
+    parser.add_argument('--explores', help='number of explores', type=int, default=200)
+    parser.add_argument('--joins', help='joins per explore', type=int, default=5)
+    parser.add_argument('--ndt-depth', help='levels of explore-derived (NDT) views stacked on the base explores', dest='ndt_depth', type=int, default=3)
+    parser.add_argument('--cycle-rate', help='share of base explores that join a top-level NDT, closing a circular reference', dest='cycle_rate', type=float, default=0.0)
+    parser.add_argument('--explores-per-model', help='explores written to each model file', dest='explores_per_model', type=int, default=50)
+    parser.add_argument('--files-per-dir', help='files per sub-directory (0 keeps every file in the top level)', dest='files_per_dir', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', help='runs per phase; the fastest is reported', type=int, default=1)
+    parser.add_argument('--jobs', help='passed through to parse_all_files', type=int, default=1)
+    parser.add_argument('--tree-format', help='tree or dag output, as in lookml_parser.py', dest='tree_format', choices=['tree', 'dag'], default='tree')
+    parser.add_argument('--field-index', help='also collect fields and time writing ' + lookml_parser.FIELD_INDEX_FILE + ', as in lookml_parser.py', dest='field_index', action='store_true')
+    parser.add_argument('--directory', help='write the synthetic repository here and keep it', default=None)
+    parser.add_argument('--output', help='JSON results file (default: stdout)', default=None)
+    args = parser.parse_args()
+    return args
+
+def view_ml(view_name, source=None):
+    if source is None:
+        return ('view: ' + view_name + ' {\n'
+                '  sql_table_name: analytics.' + view_name + ' ;;\n'
+                '  dimension: id {\n    primary_key: yes\n    sql: ${TABLE}.id ;;\n  }\n'
+                '  dimension: name {\n    sql: ${TABLE}.name ;;\n  }\n'
+                '  measure: count {\n    type: count\n  }\n'
+                '}\n')
+    return ('view: ' + view_name + ' {\n'
+            '  derived_table: {\n'
+            '    explore_source: ' + source + ' {\n'
+            '      column: id { field: ' + source + '.id }\n'
+            '    }\n'
+            '  }\n'
+            '  dimension: id {\n    sql: ${TABLE}.id ;;\n  }\n'
+            '}\n')
+
+def explore_ml(explore_name, base_view, join_views):
+    ml = 'explore: ' + explore_name + ' {\n  from: ' + base_view + '\n'
+    for join_view in join_views:
+        ml += ('  join: ' + join_view + ' {\n'
+               '    type: left_outer\n'
+               '    sql_on: ${' + explore_name + '.id} = ${' + join_view + '.id} ;;\n'
+               '    relationship: many_to_one\n'
+               '  }\n')
+    return ml + '}\n'
+
+def generate_repository(directory, views=1000, explores=200, joins=5, ndt_depth=3, cycle_rate=0.0, explores_per_model=50, files_per_dir=0, seed=0):
+    '''
+    explores are split into ndt_depth + 1 levels. level 0 explores read sql table views only;
+    every explore on level L > 0 is based on an NDT view derived from a random explore on level L - 1,
+    so lineage chains are ndt_depth NDTs deep. cycle_rate of the level 0 explores also join the top
+    level NDT of a chain that ends at that explore, which closes a circular reference through the whole
+    chain; when no chain ends there, the bottom link of a chain that does not close a circular reference
+    yet is moved to it (so each one closes a loop until every top level chain is used)
+    '''
+    rng = random.Random(seed)
+    files = {}
+
+    sql_views = ['view_' + str(i) for i in range(views)]
+    for view_name in sql_views:
+        files[view_name + '.view.lkml'] = view_ml(view_name)
+
+    levels = ndt_depth + 1
+    explore_names = ['explore_' + str(j) for j in range(explores)]
+    explore_levels = [j * levels // max(explores, 1) for j in range(explores)]
+    explores_by_level = {}
+    for explore_name, level in zip(explore_names, explore_levels):
+        explores_by_level.setdefault(level, []).append(explore_name)
+
+    base_views = {}
+    source_explores = {}
+    for explore_name, level in zip(explore_names, explore_levels):
+        if level == 0 or not explores_by_level.get(level - 1):
+            base_views[explore_name] = rng.choice(sql_views)
+        else:
+            source_explores[explore_name] = rng.choice(explores_by_level[level - 1])
+            base_views[explore_name] = 'ndt_' + explore_name
+
+    def chain_root(explore_name):
+        while explore_name in source_explores:
+            explore_name = source_explores[explore_name]
+        return explore_name
+
+    level_0 = set(explores_by_level.get(0, []))
+    top_explores = [explore_name for explore_name in explores_by_level.get(levels - 1, []) if explore_name in source_explores]
+    closed = set()
+
+    def closing_ndt(explore_name):
+        '''the base NDT of a top level explore whose chain ends at explore_name, or None when no chain is left to move'''
+        ending = [top for top in top_explores if chain_root(top) == explore_name]
+        if not ending:
+            movable = [top for top in top_explores if chain_root(top) in level_0 - closed]
+            if not movable:
+                return None
+            top = rng.choice(movable)
+            bottom = top
+            while source_explores[bottom] in source_explores:
+                bottom = source_explores[bottom]
+            source_explores[bottom] = explore_name
+            ending = [top]
+        closed.add(explore_name)
+        return base_views[rng.choice(ending)]
+
+    model_ml = {}
+    for j, explore_name in enumerate(explore_names):
+        join_views = rng.sample(sql_views, min(joins, len(sql_views)))
+        if explore_levels[j] == 0 and top_explores and rng.random() < cycle_rate:
+            ndt_name = closing_ndt(explore_name)
+            if ndt_name is not None:
+                join_views.append(ndt_name)
+        model_file = 'model_' + str(j // explores_per_model) + '.model.lkml'
+        model_ml.setdefault(model_file, ['connection: "warehouse"\ninclude: "*.view.lkml"\n\n'])
+        model_ml[model_file].append(explore_ml(explore_name, base_views[explore_name], join_views))
+
+    for explore_name, source_explore in source_explores.items():
+        files['ndt_' + explore_name + '.view.lkml'] = view_ml('ndt_' + explore_name, source_explore)
+
+    for model_file, chunks in model_ml.items():
+        files[model_file] = '\n'.join(chunks)
+
+    os.makedirs(os.path.join(directory, 'trees'), exist_ok=True)
+    with open(os.path.join(directory, 'trees', 'tree_template.html'), 'w') as f:
+        f.write(TREE_TEMPLATE)
+
+    for i, (filename, ml) in enumerate(sorted(files.items())):
+        if files_per_dir:
+            folder = os.path.join(directory, 'dir_' + str(i // files_per_dir))
+        else:
+            folder = directory
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, filename), 'w') as f:
+            f.write(ml)
+
+    return {'files': len(files), 'views': len(sql_views) + sum(1 for name in files if name.startswith('ndt_')), 'explores': explores}
+
+def time_phases(directory, jobs=1, tree_format='tree', field_index=False):
+    '''runs the phases of lookml_parser.main() one after another and returns seconds per phase'''
+    timings = {}
+    cwd = os.getcwd()
+    try:
+        start = time.perf_counter()
+        path_index = lookml_parser.discover(directory)
+        model_files, view_files = path_index.model_files, path_index.view_files
+        timings['discover'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        includes = {}
+        fields = {} if field_index else None
+        views_info, explores_info = lookml_parser.parse_all_files(view_files, model_files, jobs, includes=includes, fields=fields)
+        timings['parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        views_table, explores_table, views_derived_explore_join = lookml_parser.build_tables(views_info, explores_info)
+        timings['frames'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        explores_table = lookml_parser.build_includes(views_table, explores_table, views_derived_explore_join)
+        lookml_parser.write_declared_includes(path_index, includes)
+        timings['includes'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        lookml_parser.write_lineage_index(views_table, explores_table)
+        if field_index:
+            lookml_parser.write_field_index(views_table, explores_table, fields)
+        timings['index'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if tree_format == 'dag':
+            dag = lookml_parser.build_dag(views_table, explores_table)
+            endpoint_explores = len(dag['roots'])
+        else:
+            end_explores_info = lookml_parser.build_trees(views_table, explores_table)
+            endpoint_explores = len(end_explores_info)
+        timings['trees'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if tree_format == 'dag':
+            lookml_parser.write_dag(os.getcwd(), dag)
+        else:
+            lookml_parser.write_trees(os.getcwd(), end_explores_info)
+        timings['write'] = time.perf_counter() - start
+        output_bytes = sum(entry.stat().st_size for entry in os.scandir('trees') if entry.is_file())
+    finally:
+        os.chdir(cwd)
+
+    counts = {
+        'view_files': len(view_files),
+        'model_files': len(model_files),
+        'views': len(views_info),
+        'explores': len(explores_info),
+        'endpoint_explores': endpoint_explores,
+        'tree_output_bytes': output_bytes,
+    }
+    return timings, counts
+
+def main():
+    args = parse_args()
+    settings = {
+        'views': args.views,
+        'explores': args.explores,
+        'joins': args.joins,
+        'ndt_depth': args.ndt_depth,
+        'cycle_rate': args.cycle_rate,
+        'explores_per_model': args.explores_per_model,
+        'files_per_dir': args.files_per_dir,
+        'seed': args.seed,
+    }
+
+    directory = os.path.abspath(args.directory) if args.directory else tempfile.mkdtemp(prefix='lookml_benchmark_')
+    try:
+        generated = generate_repository(directory, **settings)
+        runs = [time_phases(directory, args.jobs, args.tree_format, args.field_index) for _ in range(max(args.repeat, 1))]
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    phases = {phase: min(timings[phase] for timings, _ in runs) for phase in PHASES}
+    results = {
+        'settings': settings,
+        'generated': generated,
+        'counts': runs[0][1],
+        'repeat': len(runs),
+        'jobs': args.jobs,
+        'tree_format': args.tree_format,
+        'field_index': args.field_index,
+        'python': platform.python_version(),
+        'phases': phases,
+        'total': sum(phases.values()),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse, json, os, subprocess, sys
+
+import lookml_parser
+
+'''
+Call git diff with: [python lookml_git_diff.py -wd 'git repository' <base revision> <head revision> [--path lookml/folder]]
+Compares the LookML of two revisions read straight from the git object database, without a checkout:
+1. files added, removed and modified between the revisions
+2. views and explores added, removed or changed
+3. lineage edges (view -> explore, explore -> view) added and removed
+4. view/model include rows and resolved include: patterns added and removed
+
+Only blobs that have not been parsed before are parsed: files that are the same in both revisions are parsed once,
+and parsed blobs are cached under the repository's git directory (.git/lookml_helper) for later runs
+'''
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-wd', '--working-directory', help='git repository', dest='wd', default='.')
+    parser.add_argument('--path', help='folder of the LookML project inside the repository (default: the repository root)', default='')
+    parser.add_argument('--no-cache', help='reparse every blob instead of reusing the blob cache', dest='use_cache', action='store_false')
+    parser.add_argument('-j', '--jobs', help='number of processes used to parse blobs (0 = one per core)', dest='jobs', type=int, default=1)
+    parser.add_argument('--format', help='output format', choices=['json', 'text'], default='json')
+    parser.add_argument('--output', help='output file (default: stdout)', default=None)
+    parser.add_argument('base', help='base revision (commit, branch or tag)')
+    parser.add_argument('head', help='head revision (commit, branch or tag)')
+    args = parser.parse_args()
+    return args
+
+'''
+git snapshots
+
+blob ids come from git ls-tree and contents from one git cat-file --batch process. a blob id is the hash of
+the file content, so a (path, blob) pair is parsed at most once: files that are the same in both revisions share
+one result, and results are kept in GIT_CACHE_FILE inside the git directory (discarded with the parse cache
+whenever lookml_parser.CACHE_VERSION changes). each revision is then assembled as parse_all_files would,
+and the two are compared on views, explores, lineage edges, include rows and resolved include: patterns
+'''
+
+GIT_CACHE_DIR = 'lookml_helper'
+GIT_CACHE_FILE = 'blob_cache.json'
+GIT_DIFF_VERSION = 1
+
+def git(repository, *args):
+    return subprocess.run(['git', '-C', repository] + list(args), check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+
+def git_commit(repository, revision):
+    try:
+        return git(repository, 'rev-parse', '--verify', '--quiet', revision + '^{commit}').decode().strip()
+    except subprocess.CalledProcessError:
+        raise ValueError('not a commit in ' + repository + ': ' + revision) from None
+
+def git_tree_files(repository, commit, prefix=''):
+    '''
+    path -> blob id of every indexed file at commit below prefix (paths relative to prefix, as lookml_parser.PathIndex.scan
+    would list them from that folder); hidden files and folders, symlinks and submodules are skipped
+    '''
+    prefix = prefix.strip('/')
+    prefix = prefix + '/' if prefix else ''
+    files = {}
+    for entry in git(repository, 'ls-tree', '-r', '-z', '--full-tree', commit).split(b'\0'):
+        if not entry:
+            continue
+        info, _, path = entry.partition(b'\t')
+        mode, object_type, blob = info.split()
+        path = path.decode()
+        if object_type != b'blob' or mode == b'120000' or not path.startswith(prefix):
+            continue
+        path = path[len(prefix):]
+        if path.endswith(lookml_parser.INDEXED_SUFFIXES) and not any(part.startswith('.') for part in path.split('/')):
+            files[path] = blob.decode()
+    return files
+
+def git_read_blobs(repository, blobs):
+    '''yields (blob id, content) for each id, through a single git cat-file --batch process'''
+    with subprocess.Popen(['git', '-C', repository, 'cat-file', '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE) as process:
+        try:
+            for blob in blobs:
+                process.stdin.write(blob.encode() + b'\n')
+                process.stdin.flush()
+                header = process.stdout.readline().split()
+                if len(header) != 3:
+                    raise ValueError('git cat-file could not read blob ' + blob)
+                data = process.stdout.read(int(header[2]) + 1)
+                yield blob, data[:-1]
+        finally:
+            process.stdin.close()
+
+def parse_blob(lookml_file, file_type, data):
+    '''(views_info, explores_info, includes, fields_info) of a blob, as stored in the parse caches'''
+    return lookml_parser.parse_ml(lookml_file, file_type, lookml_parser.decode_ml(data), collect_fields=False)[:4]
+
+def git_cache_dir(repository):
+    return os.path.join(git(repository, 'rev-parse', '--absolute-git-dir').decode().strip(), GIT_CACHE_DIR)
+
+def _file_type(lookml_file):
+    if lookml_file.endswith('.view.lkml'):
+        return 'view'
+    if lookml_file.endswith('.model.lkml'):
+        return 'model'
+    return None
+
+def parse_git_revisions(repository, trees, jobs=1, cache=None, blob_stats=None):
+    '''
+    trees are git_tree_files results; returns (path, blob id) -> parse_blob result for every view and model file
+    in any of them. cache, when given, is read and updated in place and keeps only the blobs used by this run.
+    blob_stats, when given, gets the number of blobs that were cached, parsed, and shared between trees
+    '''
+    wanted = {}
+    for files in trees:
+        for lookml_file, blob in files.items():
+            file_type = _file_type(lookml_file)
+            if file_type is not None:
+                wanted[lookml_file, blob] = file_type
+
+    results = {}
+    pending = []
+    for key in wanted:
+        cached_result = cache.get(key[1] + ':' + key[0]) if cache is not None else None
+        if cached_result is None:
+            pending.append(key)
+        else:
+            results[key] = cached_result
+
+    blobs = dict(git_read_blobs(repository, sorted({blob for _, blob in pending})))
+    pending_files = [lookml_file for lookml_file, _ in pending]
+    pending_file_types = [wanted[key] for key in pending]
+    pending_data = [blobs[blob] for _, blob in pending]
+    parsed = lookml_parser.map_parse(parse_blob, jobs, pending_files, pending_file_types, pending_data)
+    del blobs, pending_data
+
+    for key, result in zip(pending, parsed):
+        results[key] = result
+    if cache is not None:
+        used = {blob + ':' + lookml_file for lookml_file, blob in wanted}
+        for stale_key in set(cache) - used:
+            del cache[stale_key]
+        for (lookml_file, blob), result in zip(pending, parsed):
+            cache[blob + ':' + lookml_file] = list(result)
+
+    if blob_stats is not None:
+        blob_stats['cached'] = len(wanted) - len(pending)
+        blob_stats['parsed'] = len(pending)
+        blob_stats['shared'] = sum(1 for key in wanted if all(files.get(key[0]) == key[1] for files in trees))
+    return results
+
+def git_snapshot(files, results, interner=None):
+    '''
+    the views, explores, lineage edges, include rows and resolved include: patterns of one revision,
+    keyed so two snapshots can be compared with diff_git_snapshots. files is a git_tree_files result
+    '''
+    if interner is None:
+        interner = lookml_parser.Interner()
+    view_files = [lookml_file for lookml_file in files if _file_type(lookml_file) == 'view']
+    model_files = [lookml_file for lookml_file in files if _file_type(lookml_file) == 'model']
+    views_table = []
+    explores_table = []
+    includes = {}
+    for lookml_file in view_files + model_files:
+        result = results[lookml_file, files[lookml_file]]
+        file_views_info, file_explores_info = lookml_parser.to_records(interner, result[0], result[1])
+        views_table.extend(file_views_info)
+        explores_table.extend(file_explores_info)
+        if result[2]:
+            includes[lookml_file] = result[2]
+
+    explore_names = {explore['explore_name'] for explore in explores_table}
+    referenced_explore_names = {view['view_source_name'] for view in views_table if lookml_parser.is_explore_derived(view)} & explore_names
+
+    views = {}
+    for view in views_table:
+        views.setdefault((view['view_file_location'], view['view_name']), {column: view[column] for column in lookml_parser.VIEW_COLUMNS})
+    explores = {}
+    for explore in explores_table:
+        row = {column: explore[column] for column in lookml_parser.EXPLORE_COLUMNS}
+        row['is_endpoint_explore'] = explore['explore_name'] not in referenced_explore_names
+        explores.setdefault((explore['explore_file_location'], explore['explore_name']), row)
+
+    graph = lookml_parser.LineageGraph.from_tables(views_table, explores_table)
+    edges = {(lookml_parser.node_id(*node), lookml_parser.node_id(*successor)) for node in graph.nodes() for successor in graph.successors(node)}
+
+    include_index = lookml_parser.IncludeIndex()
+    include_index.load(views_table, explores_table)
+    include_rows = set()
+    for file_type, rows in (('view', include_index.view_includes), ('model', include_index.model_includes)):
+        include_rows.update((lookml_file, file_type, include_file) for lookml_file, include_files in rows.items() for include_file in include_files)
+
+    declared_includes = {tuple(row[column] for column in lookml_parser.DECLARED_INCLUDE_COLUMNS) for row in lookml_parser.resolve_declared_includes(lookml_parser.PathIndex(list(files)), includes)}
+    return {'views': views, 'explores': explores, 'edges': edges, 'includes': include_rows, 'declared_includes': declared_includes}
+
+def _sort_key(row):
+    return tuple((value is None, str(value)) for value in row)
+
+def diff_git_snapshots(base, head):
+    '''added, removed and (for views and explores) changed rows between two git_snapshot results, sorted by file and name'''
+    diff = {}
+    for table, key_columns in (('views', ['view_file_location', 'view_name']), ('explores', ['explore_file_location', 'explore_name'])):
+        diff[table] = {
+            'added': [head[table][key] for key in sorted(head[table].keys() - base[table].keys(), key=_sort_key)],
+            'removed': [base[table][key] for key in sorted(base[table].keys() - head[table].keys(), key=_sort_key)],
+            'changed': [
+                dict(zip(key_columns, key), before=base[table][key], after=head[table][key])
+                for key in sorted(base[table].keys() & head[table].keys(), key=_sort_key)
+                if base[table][key] != head[table][key]
+            ],
+        }
+    diff['edges'] = {
+        'added': [list(edge) for edge in sorted(head['edges'] - base['edges'])],
+        'removed': [list(edge) for edge in sorted(base['edges'] - head['edges'])],
+    }
+    for table, columns in (('includes', ['file_location', 'file_type', 'include_file_location']), ('declared_includes', lookml_parser.DECLARED_INCLUDE_COLUMNS)):
+        diff[table] = {
+            'added': [dict(zip(columns, row)) for row in sorted(head[table] - base[table], key=_sort_key)],
+            'removed': [dict(zip(columns, row)) for row in sorted(base[table] - head[table], key=_sort_key)],
+        }
+    return diff
+
+def git_diff(repository, base_revision, head_revision, prefix='', jobs=1, use_cache=True):
+    '''the diff_git_snapshots of two revisions, with the commits, the files that changed between them and the blob counts'''
+    base_commit = git_commit(repository, base_revision)
+    head_commit = git_commit(repository, head_revision)
+    base_files = git_tree_files(repository, base_commit, prefix)
+    head_files = git_tree_files(repository, head_commit, prefix)
+
+    cache_dir = git_cache_dir(repository) if use_cache else None
+    cache = lookml_parser.load_cache(cache_dir, GIT_CACHE_FILE, 'blobs') if use_cache else None
+    blob_stats = {}
+    results = parse_git_revisions(repository, [base_files, head_files], jobs, cache, blob_stats)
+    if cache is not None:
+        lookml_parser.save_cache(cache_dir, GIT_CACHE_FILE, 'blobs', cache)
+    del cache
+
+    interner = lookml_parser.Interner()
+    diff = {
+        'version': GIT_DIFF_VERSION,
+        'base': base_commit,
+        'head': head_commit,
+        'path': prefix.strip('/'),
+        'blobs': blob_stats,
+        'files': {
+            'added': sorted(head_files.keys() - base_files.keys()),
+            'removed': sorted(base_files.keys() - head_files.keys()),
+            'modified': sorted(lookml_file for lookml_file in base_files.keys() & head_files.keys() if base_files[lookml_file] != head_files[lookml_file]),
+        },
+    }
+    diff.update(diff_git_snapshots(git_snapshot(base_files, results, interner), git_snapshot(head_files, results, interner)))
+    return diff
+
+
+def format_text(diff):
+    lines = ['base ' + diff['base'], 'head ' + diff['head']]
+    lines.append('blobs: ' + ', '.join(str(count) + ' ' + name for name, count in diff['blobs'].items()))
+    for status, marker in (('added', '+'), ('removed', '-'), ('modified', '~')):
+        lines.extend(marker + ' file ' + lookml_file for lookml_file in diff['files'][status])
+    for table, node_type in (('views', 'view'), ('explores', 'explore')):
+        name_column, file_column = node_type + '_name', node_type + '_file_location'
+        for status, marker in (('added', '+'), ('removed', '-'), ('changed', '~')):
+            for row in diff[table][status]:
+                line = marker + ' ' + lookml_parser.node_id(node_type, row[name_column]) + '  (' + row[file_column] + ')'
+                if status == 'changed':
+                    line += '  ' + ', '.join(column + ': ' + repr(row['before'][column]) + ' -> ' + repr(row['after'][column]) for column in row['before'] if row['before'][column] != row['after'][column])
+                lines.append(line)
+    for status, marker in (('added', '+'), ('removed', '-')):
+        lines.extend(marker + ' edge ' + source + ' -> ' + target for source, target in diff['edges'][status])
+    for status, marker in (('added', '+'), ('removed', '-')):
+        lines.extend(marker + ' include ' + row['file_location'] + ' -> ' + row['include_file_location'] for row in diff['includes'][status])
+    for status, marker in (('added', '+'), ('removed', '-')):
+        lines.extend(marker + ' declared include ' + row['file_location'] + ' ' + repr(row['include_pattern']) + ' -> ' + str(row['include_file_location'] or '') for row in diff['declared_includes'][status])
+    return '\n'.join(lines) + '\n'
+
+def main():
+    args = parse_args()
+    diff = git_diff(args.wd, args.base, args.head, args.path, args.jobs, args.use_cache)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump(diff, output, indent=2)
+            output.write('\n')
+        else:
+            output.write(format_text(diff))
+    finally:
+        if args.output:
+            output.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
-import argparse, os, glob, json
-import numpy as np
-import pandas as pd
+import argparse, os, json, hashlib, time, csv, mmap, posixpath, importlib.util
+from collections import deque
+from itertools import count, repeat
+from contextlib import contextmanager
 import re
+from array import array
 
 '''
 Call parser with: [python lookml_parser.py -wd 'LookML repository']
@@ -17,42 +19,284 @@ Generates:
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-wd', '--working-directory', help='LookML directory', dest='wd', required=True)
+    parser.add_argument('--no-cache', help='reparse every file instead of reusing ' + CACHE_DIR, dest='use_cache', action='store_false')
+    parser.add_argument('--profile', help='write per-phase and per-file timings to ' + PROFILE_FILE, dest='profile', action='store_true')
+    parser.add_argument('--cprofile', help='also dump cProfile stats to ' + CPROFILE_FILE + ' (implies --profile)', dest='cprofile', action='store_true')
+    parser.add_argument('--tree-format', help='tree: one expanded JSON/HTML per endpoint explore; dag: one shared node/edge file and viewer', dest='tree_format', choices=['tree', 'dag'], default='tree')
+    parser.add_argument('--watch', help='after the run, keep polling the directory and update outputs for changed files', dest='watch', action='store_true')
+    parser.add_argument('--format', help='also write normalized view/explore/explore_view/include tables to ' + TABLES_SQLITE_FILE + ' (sqlite) or ' + TABLES_DIR + '/ (jsonl, parquet)', dest='output_format', choices=OUTPUT_FORMATS, default='csv')
+    parser.add_argument('--declared-include-files', help='write one row per file each include: pattern matches to ' + DECLARED_INCLUDES_FILE + ', instead of one row per pattern with a match count', dest='declared_include_files', action='store_true')
+    parser.add_argument('--minimal-includes', help='write the minimal include set of every file, with missing and redundant includes, to ' + MINIMAL_INCLUDES_FILE, dest='minimal_includes', action='store_true')
+    parser.add_argument('--schedule', help='write a level-by-level derived table rebuild plan to ' + SCHEDULE_FILE, dest='schedule', action='store_true')
+    parser.add_argument('--field-index', help='write field-level lineage (columns, fields and join sql_on) to ' + FIELD_INDEX_FILE, dest='field_index', action='store_true')
+    parser.add_argument('-j', '--jobs', help='number of processes used to parse files (0 = one per core)', dest='jobs', type=int, default=1)
     args = parser.parse_args()
+    if args.output_format == 'parquet':
+        '''checked up front so a missing pyarrow fails before any file is parsed or written'''
+        if importlib.util.find_spec('pyarrow') is None:
+            parser.error('--format parquet needs pyarrow (pip install pyarrow)')
     return args
 
+MMAP_MIN_BYTES = 1 << 20
+
 def return_ml(view):
-    with open(view, 'r') as f:
-        ml = f.read()
+    '''files of MMAP_MIN_BYTES or more are decoded straight from a memory map instead of being read into a buffer first'''
+    if os.path.getsize(view) < MMAP_MIN_BYTES:
+        with open(view, 'r', encoding='utf-8') as f:
+            ml = f.read()
+        return ml
+    with open(view, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return decode_ml(mapped)
+
+def decode_ml(data):
+    '''utf-8 bytes (or any buffer) -> LookML text with universal newlines, as return_ml's open(..., 'r', encoding='utf-8') would return it'''
+    ml = str(data, 'utf-8')
+    if '\r' in ml:
+        ml = ml.replace('\r\n', '\n').replace('\r', '\n')
     return ml
 
-def parse_files(wd):
+def discover(wd):
+    '''outputs are written next to the LookML files, so main() runs from the working directory'''
     os.chdir(wd)
+    return PathIndex.scan('.')
 
-    model_files = []
-    view_files = []
-    docs = []
+def parse_files(wd):
+    path_index = discover(wd)
+    return path_index.model_files, path_index.view_files, path_index.docs
 
-    for file in glob.glob('*.model.lkml'):
-        model_files.append(file)
+'''
+project discovery
 
-    for file in glob.glob('*.view.lkml'):
-        view_files.append(file)
+the working directory is walked once with os.scandir and every LookML and markdown file is kept, by relative
+/-separated path, in a PathIndex. include: patterns are matched against that index instead of the disk:
+a leading / is the project root, other patterns are relative to the including file, * stays within a folder,
+** crosses folders, and the .lkml extension may be left off. remote (//project) includes are not resolved.
+top-level files keep the order glob returned, so flat projects produce the same output as before
+'''
 
-    for file in glob.glob('*.md'):
-        docs.append(file)
+INDEXED_SUFFIXES = ('.lkml', '.lookml', '.md')
+
+class PathIndex:
+    def __init__(self, paths):
+        self.paths = paths
+        self.by_directory = {}
+        for path in paths:
+            self.by_directory.setdefault(posixpath.dirname(path), []).append(path)
+        self.model_files = [path for path in paths if path.endswith('.model.lkml')]
+        self.view_files = [path for path in paths if path.endswith('.view.lkml')]
+        self.docs = [path for path in paths if path.endswith('.md')]
+        self._patterns = {}
+
+    @classmethod
+    def scan(cls, root='.'):
+        '''
+        files of a folder come before those of its sub-folders; hidden files and folders are skipped, as glob does.
+        symlinked folders are not followed, so a link back to a parent folder cannot loop
+        '''
+        paths = []
+        pending = ['']
+        while pending:
+            directory = pending.pop()
+            folders = []
+            with os.scandir(os.path.join(root, directory)) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    path = directory + '/' + entry.name if directory else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(path)
+                    elif entry.name.endswith(INDEXED_SUFFIXES):
+                        paths.append(path)
+            pending.extend(reversed(folders))
+        return cls(paths)
+
+    def resolve(self, pattern, from_file=''):
+        '''indexed paths matched by an include: pattern declared in from_file, in index order'''
+        if pattern.startswith('//'):
+            return []
+        if pattern.startswith('/'):
+            pattern = pattern.lstrip('/')
+        else:
+            pattern = posixpath.normpath(posixpath.join(posixpath.dirname(from_file), pattern))
+        if pattern not in self._patterns:
+            self._patterns[pattern] = self._match(pattern)
+        return self._patterns[pattern]
+
+    def _match(self, pattern):
+        segments = pattern.split('/')
+        literal = 0
+        while literal < len(segments) - 1 and '*' not in segments[literal]:
+            literal += 1
+        prefix = '/'.join(segments[:literal])
+        if literal == len(segments) - 1 and '**' not in segments[-1]:
+            candidates = self.by_directory.get(prefix, [])
+        else:
+            candidates = [path for path in self.paths if not prefix or path.startswith(prefix + '/')]
 
-    return model_files, view_files, docs
+        regex = ''
+        for part in re.split(r'(\*\*/|\*\*|\*)', pattern):
+            regex += {'**/': '(?:.*/)?', '**': '.*', '*': '[^/]*'}.get(part, re.escape(part))
+        compiled = re.compile(regex + r'(?:\.lkml)?')
+        return [path for path in candidates if compiled.fullmatch(path)]
 
-def get_explores(model_file, file_type, ml):
-    explores_info = []
+'''
+LookML lexer
 
-    explores_raw = re.findall(r"explore:([a-zA-Z0-9_\s]+){", ml)
-    explores = []
-    for explore_raw in explores_raw:
-        explores.append(explore_raw.strip())
+A single left-to-right pass over a file that tracks brace depth and returns every
+`key: [name] {` block with its character offsets, direct parameters and nested blocks.
+Parameters whose values run to `;;` (sql, html, ...) are consumed whole, so braces and
+`${...}` inside SQL never disturb the depth count; `#` comments are skipped.
+'''
 
-    num_explores = len(explores)
+_WHITESPACE = re.compile(r'\s*')
+_KEY = re.compile(r'([A-Za-z_][A-Za-z0-9_]*)\s*:')
+_BARE_VALUE = re.compile(r'[^\s{}\[\]"#,]+')
+_NAME = re.compile(r'[A-Za-z0-9_]+')
+_SQL_TABLE_NAME = re.compile(r'[\"a-zA-Z0-9._\s]*')
+_SEMICOLON_KEYS = ('html', 'expression', 'filter_expression')
+
+def _skip_quoted(ml, pos):
+    '''pos is on the opening quote; return the offset after the closing quote'''
+    n = len(ml)
+    pos += 1
+    while pos < n:
+        char = ml[pos]
+        if char == '\\':
+            pos += 2
+        elif char == '"':
+            return pos + 1
+        else:
+            pos += 1
+    return n
+
+def _skip_list(ml, pos):
+    '''pos is on the opening bracket; return the offset after the closing bracket'''
+    n = len(ml)
+    pos += 1
+    while pos < n:
+        char = ml[pos]
+        if char == '"':
+            pos = _skip_quoted(ml, pos)
+        elif char == ']':
+            return pos + 1
+        else:
+            pos += 1
+    return n
 
+def lex_lookml(ml, top_params=None):
+    '''
+    returns the top-level blocks of a LookML file as dicts:
+        {'type', 'name', 'start', 'end', 'params': [(key, value, start)], 'children': [blocks]}
+    top-level parameters (include:, connection:, ...) are appended to top_params when it is given
+    '''
+    roots = []
+    stack = []
+    n = len(ml)
+    pos = 0
+
+    while pos < n:
+        pos = _WHITESPACE.match(ml, pos).end()
+        if pos >= n:
+            break
+        char = ml[pos]
+
+        if char == '#':
+            newline = ml.find('\n', pos)
+            pos = n if newline == -1 else newline + 1
+            continue
+
+        if char == '}':
+            if stack:
+                stack.pop()['end'] = pos + 1
+            pos += 1
+            continue
+
+        key_match = _KEY.match(ml, pos)
+        if not key_match:
+            if char == '"':
+                pos = _skip_quoted(ml, pos)
+            elif char == '[':
+                pos = _skip_list(ml, pos)
+            else:
+                pos += 1
+            continue
+
+        key = key_match.group(1)
+        key_start = pos
+        pos = _WHITESPACE.match(ml, key_match.end()).end()
+        char = ml[pos] if pos < n else ''
+        name = None
+
+        if char == '{' and ml[pos + 1:pos + 2] not in ('%', '{'):
+            '''a block (sql_always_filter: { ... }); a value opening with liquid ({% or {{) still runs to ;;'''
+            param = None
+        elif key.startswith('sql') or key in _SEMICOLON_KEYS:
+            value_end = ml.find(';;', pos)
+            if value_end == -1:
+                value_end = n
+            param = (key, ml[pos:value_end], key_start)
+            pos = value_end + 2
+        elif char == '"':
+            value_end = _skip_quoted(ml, pos)
+            param = (key, ml[pos + 1:value_end - 1], key_start)
+            pos = value_end
+        elif char == '[':
+            value_end = _skip_list(ml, pos)
+            param = (key, ml[pos + 1:value_end - 1], key_start)
+            pos = value_end
+        else:
+            value_match = _BARE_VALUE.match(ml, pos)
+            if not value_match:
+                continue
+            name = value_match.group(0)
+            pos = _WHITESPACE.match(ml, value_match.end()).end()
+            if pos < n and ml[pos] == '{':
+                param = None
+            else:
+                param = (key, name, key_start)
+
+        if param is not None:
+            if stack:
+                stack[-1]['params'].append(param)
+            elif top_params is not None:
+                top_params.append(param)
+            continue
+
+        block = {'type': key, 'name': name, 'start': key_start, 'end': n, 'params': [], 'children': []}
+        if stack:
+            stack[-1]['children'].append(block)
+        else:
+            roots.append(block)
+        stack.append(block)
+        pos += 1
+
+    return roots
+
+def iter_blocks(blocks, block_type=None):
+    '''yields blocks and all of their nested blocks in document order'''
+    pending = list(reversed(blocks))
+    while pending:
+        block = pending.pop()
+        if block_type is None or block['type'] == block_type:
+            yield block
+        pending.extend(reversed(block['children']))
+
+def _first_entry(block):
+    '''the first parameter or nested block of a block, as (key, value)'''
+    first_param = block['params'][0] if block['params'] else None
+    first_child = block['children'][0] if block['children'] else None
+    if first_child is not None and (first_param is None or first_child['start'] < first_param[2]):
+        return first_child['type'], first_child['name']
+    if first_param is not None:
+        return first_param[0], first_param[1]
+    return None, None
+
+def _named_blocks(blocks, block_type):
+    for block in iter_blocks(blocks, block_type):
+        if block['name'] and _NAME.fullmatch(block['name']):
+            yield block
+
+def get_explores(model_file, file_type, ml, blocks=None):
     '''
     explores can be sourced in three ways:
     1. from:
@@ -60,332 +304,1150 @@ def get_explores(model_file, file_type, ml):
     3. always_join:
     4. if no view(s) are specified, the source is a view with the same name as the explore itself
     '''
+    if blocks is None:
+        blocks = lex_lookml(ml)
 
-    if num_explores > 1:
-        for explore in explores:
-            explore_info = {}
-            explore_info['explore_name'] = explore
-            explore_info['explore_file_location'] = model_file
-
-            explore_sequence = explores.index(explore)
-            explore_start_char = ml.find('explore: ' + explore)
-            if explore_sequence + 1 < num_explores:
-                explore_end_char = ml.find('explore: ' + explores[explore_sequence + 1])
-            else:
-                explore_end_char = len(ml)
-
-            explore_ml = ml[explore_start_char:explore_end_char]
-
-            source_from = re.findall(r"from:([a-zA-Z0-9._\s]*\n)",explore_ml)
-            source_join = re.findall(r"join:([a-zA-Z0-9._\s]*){", explore_ml)
-            source_always_join = re.findall(r"always_join:([\[\]a-zA-Z0-9._\s]*\n)",explore_ml)
-
-            view_sources = []
-
-            if source_from:
-                for item in source_from:
-                    view_sources.append(item.replace('\n', '').strip())
-
-            if source_join:
-                for item in source_join:
-                    view_sources.append(item.replace('\n', '').strip())
-
-            if source_always_join:
-                for item in source_always_join:
-                    view_sources.append(((item.replace('\n', '')).replace('[', '')).replace(']', '').strip())
-
-            unique_view_sources = list(set(view_sources))
-            if len(unique_view_sources) == 0:
-                unique_view_sources.append(explore)
-            explore_info['view_sources'] = unique_view_sources
-            explore_info['syntax_error'] = None
-
-            if file_type != 'model':
-                explore_info['syntax_error'] = 'flagged explore as created in view file'
-            explores_info.append(explore_info)
+    explores_info = []
 
-    elif num_explores == 1:
+    for explore_block in _named_blocks(blocks, 'explore'):
+        explore = explore_block['name']
         explore_info = {}
-        explore = explores[0]
         explore_info['explore_name'] = explore
         explore_info['explore_file_location'] = model_file
 
-        explore_ml = ml
-
-        source_from = re.findall(r"from:([a-zA-Z0-9._\s]*\n)", explore_ml)
-        source_join = re.findall(r"join:([a-zA-Z0-9._\s]*){", explore_ml)
-        source_always_join = re.findall(r"always_join:([\[\]a-zA-Z0-9._\s]*\n)", explore_ml)
+        entries = []
+        for block in iter_blocks([explore_block]):
+            entries.extend((param[2], param[0], param[1]) for param in block['params'])
+            entries.extend((child['start'], child['type'], child['name']) for child in block['children'] if child['type'] == 'join')
 
         view_sources = []
+        for _, key, value in sorted(entries):
+            if key == 'from' or (key == 'join' and value):
+                view_sources.append(value.strip())
+            elif key == 'always_join':
+                view_sources.extend(item.strip() for item in value.split(',') if item.strip())
 
-        if source_from:
-            for item in source_from:
-                view_sources.append(item.replace('\n', '').strip())
-
-        if source_join:
-            for item in source_join:
-                view_sources.append(item.replace('\n', '').strip())
-
-        if source_always_join:
-            for item in source_always_join:
-                view_sources.append(((item.replace('\n', '')).replace('[', '')).replace(']', '').strip())
-
-        unique_view_sources = list(set(view_sources))
+        unique_view_sources = list(dict.fromkeys(view_sources))
         if len(unique_view_sources) == 0:
             unique_view_sources.append(explore)
         explore_info['view_sources'] = unique_view_sources
         explore_info['syntax_error'] = None
+
         if file_type != 'model':
             explore_info['syntax_error'] = 'flagged explore as created in view file'
         explores_info.append(explore_info)
 
     return explores_info
 
-def get_views(view_file, file_type, ml):
-    """
-    once all view files have been processed, extract all view names and dependencies 
+def get_views(view_file, file_type, ml, blocks=None):
     """
-    views_info = []
+    once all view files have been processed, extract all view names and dependencies
 
-    views_raw = re.findall(r"view:([a-zA-Z0-9_\s]+){", ml)
-    views = []
-    for view_raw in views_raw:
-        views.append(view_raw.strip())
-
-    num_views = len(views)
-
-    """
     there are three types of views:
     1. sql tables (sql_table_name: [X])
     2. derived tables from explores (derived_table: { explore_source: [X] {)
     3. derived tables from sql (derived_table: { sql: )
     """
+    if blocks is None:
+        blocks = lex_lookml(ml)
 
-    if num_views > 1:
-        for view in views:
-            view_info = {}
-            view_info['view_name'] = view
-            view_info['view_file_location'] = view_file
-
-            view_sequence = views.index(view)
-            view_start_char = ml.find(view)
-            if view_sequence + 1 < num_views:
-                view_end_char = ml.find(views[view_sequence + 1], view_start_char + 50)
-            else:
-                view_end_char = len(ml)
-
-            view_ml = ml[view_start_char:view_end_char]
+    views_info = []
 
-            derived_table_explore = re.findall(r"derived_table:([\s\n]*){([\s\n]*)explore_source:([a-zA-Z0-9_\s\n]*){", view_ml)
-            derived_table_sql = re.findall(r"derived_table:([\s\n]*){([\s\n]*)sql:", view_ml)
-            sql_table = re.findall(r"sql_table_name:([a-zA-Z0-9._\s\n]*);;", view_ml)
+    for view_block in _named_blocks(blocks, 'view'):
+        view_info = {}
+        view_info['view_name'] = view_block['name']
+        view_info['view_file_location'] = view_file
 
-            view_type = None
-            view_source_type = None
-            view_source_name = None
+        view_type = None
+        view_source_type = None
+        view_source_name = None
 
-            if derived_table_explore:
+        for derived_table in iter_blocks(view_block['children'], 'derived_table'):
+            first_key, first_value = _first_entry(derived_table)
+            if first_key == 'explore_source' and first_value:
                 view_type = 'derived_table'
                 view_source_type = 'explore'
-                view_source_name = derived_table_explore[0][2].strip()
-
-            if derived_table_sql:
+                view_source_name = first_value.strip()
+            elif first_key == 'sql':
                 view_type = 'derived_table'
                 view_source_type = 'sql'
                 view_source_name = 'custom_sql_query'
+                break
 
+        for block in iter_blocks([view_block]):
+            sql_table = [param[1] for param in block['params'] if param[0] == 'sql_table_name' and _SQL_TABLE_NAME.fullmatch(param[1])]
             if sql_table:
                 view_type = 'sql_table'
                 view_source_type = 'sql'
                 view_source_name = sql_table[0].strip()
+                break
 
-            view_info['view_type'] = view_type
-            view_info['view_source_type'] = view_source_type
-            view_info['view_source_name'] = view_source_name
-            view_info['syntax_error'] = None
+        view_info['view_type'] = view_type
+        view_info['view_source_type'] = view_source_type
+        view_info['view_source_name'] = view_source_name
+        view_info['syntax_error'] = None
 
-            if file_type != 'view':
-                view_info['syntax_error'] = 'flagged view as created in model file'
+        if file_type != 'view':
+            view_info['syntax_error'] = 'flagged view as created in model file'
 
-            views_info.append(view_info)
+        views_info.append(view_info)
 
-    elif num_views == 1:
-        view_info = {}
-        view = views[0]
-        view_info['view_name'] = view
-        view_info['view_file_location'] = view_file
+    return views_info
 
-        view_sequence = views.index(view)
+'''
+field lineage
 
-        view_ml = ml
+dimensions, measures and the other field blocks of a view, and the sql_on of every explore join, are read from
+the blocks lex_lookml already returned, so fields cost no second scan of the file. the sql parameters of a field
+give the ${TABLE}.column columns it reads and the ${field} / ${view.field} fields it references; sql_on references
+are resolved through the explore's join aliases (from:) to view names
+'''
 
-        derived_table_explore = re.findall(r"derived_table:([\s\n]*){([\s\n]*)explore_source:([a-zA-Z0-9_\s\n]*){", view_ml)
-        derived_table_sql = re.findall(r"derived_table:([\s\n]*){([\s\n]*)sql:", view_ml)
-        sql_table = re.findall(r"sql_table_name:([\"a-zA-Z0-9._\s\n]*);;", view_ml)
+FIELD_TYPES = ('dimension', 'dimension_group', 'measure', 'filter', 'parameter')
+_TABLE_COLUMN = re.compile(r'\$\{TABLE\}\."?([A-Za-z0-9_]+)')
+_FIELD_REFERENCE = re.compile(r'\$\{([A-Za-z0-9_]+)(?:\.([A-Za-z0-9_]+))?\}')
+
+def _sql_references(sql, view_name, aliases=None):
+    '''(columns, references) of a sql parameter; references are view.field, with aliases mapped to view names'''
+    columns = _TABLE_COLUMN.findall(sql)
+    references = []
+    for first, second in _FIELD_REFERENCE.findall(sql):
+        if first == 'TABLE' or second == 'SQL_TABLE_NAME':
+            continue
+        if not second:
+            references.append(view_name + '.' + first)
+        else:
+            references.append((aliases or {}).get(first, first) + '.' + second)
+    return columns, references
+
+def get_fields(blocks):
+    '''field definitions of every view: {'view_name', 'field_name', 'field_type', 'columns', 'references'}'''
+    fields_info = []
+    for view_block in _named_blocks(blocks, 'view'):
+        for field_block in view_block['children']:
+            if field_block['type'] not in FIELD_TYPES or not field_block['name']:
+                continue
+            columns = []
+            references = []
+            for key, value, _ in field_block['params']:
+                if key.startswith('sql'):
+                    sql_columns, sql_references = _sql_references(value, view_block['name'])
+                    columns.extend(sql_columns)
+                    references.extend(sql_references)
+            fields_info.append({
+                'view_name': view_block['name'],
+                'field_name': field_block['name'],
+                'field_type': field_block['type'],
+                'columns': list(dict.fromkeys(columns)),
+                'references': list(dict.fromkeys(references)),
+            })
+    return fields_info
+
+def get_join_references(blocks):
+    '''fields used in the sql_on of every explore join: {'explore_name', 'join_name', 'view_name', 'references'}'''
+    joins_info = []
+    for explore_block in _named_blocks(blocks, 'explore'):
+        explore = explore_block['name']
+        joins = [block for block in iter_blocks(explore_block['children'], 'join') if block['name']]
+        aliases = {explore: next((value.strip() for key, value, _ in explore_block['params'] if key in ('from', 'view_name')), explore)}
+        for join in joins:
+            aliases[join['name']] = next((value.strip() for key, value, _ in join['params'] if key in ('from', 'view_name')), join['name'])
+        for join in joins:
+            references = []
+            for key, value, _ in join['params']:
+                if key == 'sql_on':
+                    references.extend(_sql_references(value, aliases[join['name']], aliases)[1])
+            if references:
+                joins_info.append({'explore_name': explore, 'join_name': join['name'], 'view_name': aliases[join['name']], 'references': list(dict.fromkeys(references))})
+    return joins_info
 
-        view_type = None
-        view_source_type = None
-        view_source_name = None
+'''
+files are parsed independently, so large repositories can be spread over a process pool;
+results are merged in file order so the output matches a serial run exactly
+'''
 
-        if derived_table_explore:
-            view_type = 'derived_table'
-            view_source_type = 'explore'
-            view_source_name = derived_table_explore[0][2].strip()
+PARALLEL_MIN_FILES = 200
 
-        if derived_table_sql:
-            view_type = 'derived_table'
-            view_source_type = 'sql'
-            view_source_name = 'custom_sql_query'
+def map_parse(func, jobs, *iterables):
+    '''
+    list(map(func, *iterables)), spread over jobs processes (0 = one per core) once the first iterable has
+    PARALLEL_MIN_FILES items; func must be a module-level function so it can be sent to the workers
+    '''
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs > 1 and len(iterables[0]) >= PARALLEL_MIN_FILES:
+        chunksize = max(1, len(iterables[0]) // (jobs * 4))
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(func, *iterables, chunksize=chunksize))
+    return list(map(func, *iterables))
+
+def parse_file(lookml_file, file_type, collect_fields=True):
+    '''
+    returns (views_info, explores_info, includes, fields_info, file_stats); includes are the file's include: patterns
+    as written, fields_info holds the field definitions and join sql_on references of get_fields/get_join_references
+    (None unless collect_fields), file_stats holds the parse time and block counts for --profile
+    '''
+    start = time.perf_counter()
+    return parse_ml(lookml_file, file_type, return_ml(lookml_file), start, collect_fields)
+
+def parse_ml(lookml_file, file_type, ml, start=None, collect_fields=True):
+    '''parse_file for text that is already in memory (git blobs); start is when reading began, for the timings'''
+    if start is None:
+        start = time.perf_counter()
+    top_params = []
+    blocks = lex_lookml(ml, top_params)
+    views_info = get_views(lookml_file, file_type, ml, blocks)
+    '''in the case that users are putting explores in view files (or views in model files) - red flag this syntax'''
+    explores_info = get_explores(lookml_file, file_type, ml, blocks)
+    includes = [value.strip() for key, value, _ in top_params if key == 'include']
+    fields_info = {'fields': get_fields(blocks), 'joins': get_join_references(blocks)} if collect_fields else None
+    file_stats = {
+        'seconds': time.perf_counter() - start,
+        'bytes': len(ml),
+        'blocks': sum(1 for _ in iter_blocks(blocks)),
+        'views': len(views_info),
+        'explores': len(explores_info),
+    }
+    return views_info, explores_info, includes, fields_info, file_stats
+
+def parse_all_files(view_files, model_files, jobs=1, cache=None, file_stats=None, interner=None, includes=None, fields=None):
+    '''
+    returns the ViewRecords and ExploreRecords of every file, interned in interner (a new one when not given).
+    file_stats, when given, is filled with the per-file stats of parse_file; cache hits are marked as cached.
+    includes, when given, is filled with the include: patterns of every file that declares any,
+    and fields with the fields_info of every file that defines fields or join sql_on; fields_info is only
+    collected (and only required of cache entries) when fields is given
+    '''
+    if interner is None:
+        interner = Interner()
+    files = list(view_files) + list(model_files)
+    file_types = ['view'] * len(view_files) + ['model'] * len(model_files)
+
+    collect_fields = fields is not None
+    results = [None] * len(files)
+    file_states = {}
+    pending = []
+    for i, (lookml_file, file_type) in enumerate(zip(files, file_types)):
+        if cache is None:
+            pending.append(i)
+            continue
+        cached_result, digest = lookup_parse_cache(cache, lookml_file, file_type, collect_fields)
+        if cached_result is None:
+            file_states[i] = file_state(lookml_file, digest)
+            pending.append(i)
+        else:
+            results[i] = cached_result
 
-        if sql_table:
-            view_type = 'sql_table'
-            view_source_type = 'sql'
-            view_source_name = sql_table[0].strip()
+    pending_files = [files[i] for i in pending]
+    pending_file_types = [file_types[i] for i in pending]
+    parsed = map_parse(parse_file, jobs, pending_files, pending_file_types, repeat(collect_fields))
 
-        view_info['view_type'] = view_type
-        view_info['view_source_type'] = view_source_type
-        view_info['view_source_name'] = view_source_name
-        view_info['syntax_error'] = None
+    for i, result in zip(pending, parsed):
+        results[i] = result
+        if cache is not None:
+            update_parse_cache(cache, files[i], file_types[i], result, *file_states[i])
 
-        if file_type != 'view':
-            view_info['syntax_error'] = 'flagged view as created in model file'
+    if cache is not None:
+        for stale_file in set(cache) - set(files):
+            del cache[stale_file]
 
-        views_info.append(view_info)
+    del parsed
+    views_info = []
+    explores_info = []
+    for i, lookml_file in enumerate(files):
+        result = results[i]
+        results[i] = None
+        file_views_info, file_explores_info = to_records(interner, result[0], result[1])
+        views_info.extend(file_views_info)
+        explores_info.extend(file_explores_info)
+        if includes is not None and result[2]:
+            includes[lookml_file] = result[2]
+        if fields is not None and (result[3]['fields'] or result[3]['joins']):
+            fields[lookml_file] = result[3]
+        if file_stats is not None:
+            file_stats[lookml_file] = result[4] if len(result) > 4 else {'cached': True, 'views': len(result[0]), 'explores': len(result[1])}
+
+    return views_info, explores_info
 
-    return views_info
+'''
+parse cache
+
+parsed view/explore records are kept per file in CACHE_DIR so later runs only reparse files that changed.
+an entry is reused when its mtime and size still match, or failing that when the content hash does;
+bump CACHE_VERSION whenever the parser output changes so existing caches are discarded
+'''
+
+CACHE_DIR = '.lookml_helper_cache'
+CACHE_FILE = 'parse_cache.json'
+CACHE_VERSION = 4
+
+def load_cache(cache_dir, cache_file, key):
+    '''the entries stored under key in cache_dir/cache_file, or {} when the file is missing, unreadable or of another CACHE_VERSION'''
+    try:
+        with open(os.path.join(cache_dir, cache_file), 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get(key, {})
+
+def save_cache(cache_dir, cache_file, key, cache):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, cache_file)
+    with open(cache_file + '.tmp', 'w') as f:
+        json.dump({'version': CACHE_VERSION, key: cache}, f)
+    os.replace(cache_file + '.tmp', cache_file)
+
+def file_digest(lookml_file):
+    with open(lookml_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < MMAP_MIN_BYTES:
+            return hashlib.sha256(f.read()).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+def lookup_parse_cache(cache, lookml_file, file_type, collect_fields=True):
+    '''
+    returns ((views_info, explores_info, includes, fields_info), None) on a hit, or (None, digest) on a miss;
+    an entry parsed without fields_info (None) is a miss when collect_fields is set
+    '''
+    entry = cache.get(lookml_file)
+    if entry is None or entry['file_type'] != file_type or (collect_fields and entry['fields'] is None):
+        return None, None
+    stat = os.stat(lookml_file)
+    if entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return (entry['views'], entry['explores'], entry['includes'], entry['fields']), None
+    digest = file_digest(lookml_file)
+    if entry['hash'] != digest:
+        return None, digest
+    entry['mtime'] = stat.st_mtime_ns
+    entry['size'] = stat.st_size
+    return (entry['views'], entry['explores'], entry['includes'], entry['fields']), None
+
+def file_state(lookml_file, digest=None):
+    '''
+    (stat, content hash) of a file, taken before it is parsed: if it changes while it is being read, the entry
+    then describes the older file and is missed on the next run, instead of pairing a stale parse with the new mtime
+    '''
+    stat = os.stat(lookml_file)
+    return stat, digest or file_digest(lookml_file)
+
+def update_parse_cache(cache, lookml_file, file_type, result, stat, digest):
+    '''stat and digest come from file_state before lookml_file was read'''
+    cache[lookml_file] = {
+        'file_type': file_type,
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'hash': digest,
+        'views': result[0],
+        'explores': result[1],
+        'includes': result[2],
+        'fields': result[3],
+    }
+
+'''
+profiling
+
+--profile records wall time and peak traced memory for every phase of main(), the parse time and block
+counts of every file, and the parse_sources counts of every endpoint explore, and writes them to PROFILE_FILE
+next to the CSVs. memory is traced in the main process only, so files parsed by --jobs workers report time
+but not memory. --cprofile also runs cProfile over the whole run and dumps it to CPROFILE_FILE
+'''
+
+PROFILE_FILE = 'profile.json'
+CPROFILE_FILE = 'profile.pstats'
+HOT_FUNCTIONS = 25
+
+class Profiler:
+    def __init__(self, enabled=False, use_cprofile=False):
+        self.enabled = enabled or use_cprofile
+        self.phases = []
+        self.file_stats = {} if self.enabled else None
+        self.tree_stats = [] if self.enabled else None
+        self.cprofile = None
+        if use_cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+        self.start = None
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self.start is None:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            tracemalloc.start()
+            self.start = time.perf_counter()
+            if self.cprofile is not None:
+                self.cprofile.enable()
+        self.tracemalloc.reset_peak()
+        start_bytes = self.tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            current_bytes, peak_bytes = self.tracemalloc.get_traced_memory()
+            self.phases.append({
+                'phase': name,
+                'seconds': time.perf_counter() - start,
+                'peak_bytes': peak_bytes,
+                'retained_bytes': current_bytes - start_bytes,
+            })
+
+    def hot_functions(self):
+        import pstats
+        stats = pstats.Stats(self.cprofile).stats
+        hottest = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:HOT_FUNCTIONS]
+        return [{
+            'function': os.path.basename(filename) + ':' + str(line) + '(' + function + ')',
+            'calls': calls,
+            'total_seconds': total_seconds,
+            'cumulative_seconds': cumulative_seconds,
+        } for (filename, line, function), (_, calls, total_seconds, cumulative_seconds, _) in hottest]
+
+    def write(self, profile_file=PROFILE_FILE):
+        if not self.enabled or self.start is None:
+            return
+        report = {
+            'total_seconds': time.perf_counter() - self.start,
+            'peak_bytes': max(phase['peak_bytes'] for phase in self.phases),
+            'phases': self.phases,
+            'files': [dict(file=lookml_file, **stats) for lookml_file, stats in self.file_stats.items()],
+            'endpoint_explores': self.tree_stats,
+        }
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(CPROFILE_FILE)
+            report['hot_functions'] = self.hot_functions()
+        self.tracemalloc.stop()
+        with open(profile_file, 'w') as f:
+            json.dump(report, f, indent=2)
 
 def main():
     args = parse_args()
     wd = args.wd
-    model_files, view_files, docs = parse_files(wd)
+    profiler = Profiler(args.profile, args.cprofile)
 
-    views_info = []
-    explores_info = []
+    with profiler.phase('discover'):
+        path_index = discover(wd)
+        model_files, view_files = path_index.model_files, path_index.view_files
+        '''--watch compares against the files as they were before parsing, so edits made during the run are not missed'''
+        snapshot = snapshot_files(path_index) if args.watch else None
 
     '''
     get view information
      
     1. what views are there?
     2. what sources (sql/explores) do each view reference? 
-    '''
-
-    for view_file in view_files:
-        view_file_ml = return_ml(view_file)
-        view_file_info = get_views(view_file, 'view', view_file_ml)
-        '''in the case that users are putting explores in view files - red flag this syntax'''
-        model_file_info_optional = get_explores(view_file, 'view', view_file_ml)
-        if model_file_info_optional:
-            explores_info.extend(model_file_info_optional)
-        views_info.extend(view_file_info)
 
-    '''
     get explore information
     
     1. what explores are there?
     2. what views do each explore reference? (if no external views are referenced, the name of the view = name of explore 
     '''
 
-    for model_file in model_files:
-        model_file_ml = return_ml(model_file)
-        model_file_info = get_explores(model_file, 'model', model_file_ml)
-        '''in the case that users are putting views in explore files - red flag this syntax'''
-        view_file_info_optional = get_views(model_file, 'model', model_file_ml)
-        explores_info.extend(model_file_info)
-        if view_file_info_optional:
-            views_info.extend(view_file_info_optional)
+    with profiler.phase('parse'):
+        interner = Interner()
+        includes = {}
+        fields = {} if args.field_index else None
+        cache = load_cache(CACHE_DIR, CACHE_FILE, 'files') if args.use_cache else None
+        views_info, explores_info = parse_all_files(view_files, model_files, args.jobs, cache, profiler.file_stats, interner, includes, fields)
+        if cache is not None:
+            save_cache(CACHE_DIR, CACHE_FILE, 'files', cache)
+        del cache
+
+    with profiler.phase('frames'):
+        views_table, explores_table, views_derived_explore_join = build_tables(views_info, explores_info)
+    with profiler.phase('includes'):
+        include_index = IncludeIndex()
+        explores_table = build_includes(views_table, explores_table, views_derived_explore_join, args.output_format, include_index)
+        write_declared_includes(path_index, includes, args.declared_include_files)
+    if args.minimal_includes:
+        with profiler.phase('minimal_includes'):
+            write_minimal_includes(include_index, path_index, includes)
+    with profiler.phase('index'):
+        write_lineage_index(views_table, explores_table)
+        if args.field_index:
+            write_field_index(views_table, explores_table, fields)
+    if args.schedule:
+        with profiler.phase('schedule'):
+            write_schedule(build_schedule(views_table, explores_table))
+    if args.tree_format == 'dag':
+        with profiler.phase('trees'):
+            dag = build_dag(views_table, explores_table)
+        with profiler.phase('write'):
+            write_dag(wd, dag)
+    else:
+        with profiler.phase('trees'):
+            end_explores_info = build_trees(views_table, explores_table, profiler.tree_stats)
+        with profiler.phase('write'):
+            write_trees(wd, end_explores_info)
+
+    profiler.write()
+
+    if args.watch:
+        try:
+            watch(wd, views_info, explores_info, interner, includes, fields, args.tree_format, args.output_format, args.minimal_includes, args.schedule, args.declared_include_files, snapshot)
+        except KeyboardInterrupt:
+            pass
 
-    views_df = pd.DataFrame(views_info)
-    explores_df = pd.DataFrame(explores_info)
+'''
+record tables
+
+views, explores and their joins are kept as lists of slotted records (plain python, no pandas import at startup).
+every name, file path and type string is stored once in an Interner and records hold its integer id; explore
+view sources are arrays of ids. records read like the row dicts parse_file returns (record['view_name'],
+record.get(column)), so the stages below do not care which they get.
+write_csv reproduces DataFrame.to_csv: a leading index column, empty cells for None and lists written as their repr
+'''
 
+VIEW_COLUMNS = ['view_name', 'view_type', 'view_source_type', 'view_source_name', 'view_file_location', 'syntax_error']
+EXPLORE_COLUMNS = ['explore_name', 'explore_file_location', 'view_sources', 'syntax_error']
+EXPLORE_DERIVED_VIEW_COLUMNS = ['view_name', 'view_type', 'view_source_type', 'view_source_name', 'view_file_location', 'explore_name', 'explore_file_location', 'syntax_error']
+
+class Interner:
+    '''strings <-> small integer ids; id 0 is None'''
+    def __init__(self):
+        self.strings = [None]
+        self.ids = {None: 0}
+
+    def id(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def ids_of(self, values):
+        return array('I', map(self.id, values))
+
+def _interned(slot):
+    return property(lambda record: record.interner.strings[getattr(record, slot)])
+
+class _Record:
+    __slots__ = ('interner',)
+
+    def __getitem__(self, column):
+        return getattr(self, column)
+
+    def get(self, column, default=None):
+        return getattr(self, column, default)
+
+class ViewRecord(_Record):
+    __slots__ = ('name_id', 'type_id', 'source_type_id', 'source_name_id', 'file_id', 'error_id')
+
+    view_name = _interned('name_id')
+    view_type = _interned('type_id')
+    view_source_type = _interned('source_type_id')
+    view_source_name = _interned('source_name_id')
+    view_file_location = _interned('file_id')
+    syntax_error = _interned('error_id')
+
+    def __init__(self, interner, view_info):
+        self.interner = interner
+        self.name_id = interner.id(view_info['view_name'])
+        self.type_id = interner.id(view_info['view_type'])
+        self.source_type_id = interner.id(view_info['view_source_type'])
+        self.source_name_id = interner.id(view_info['view_source_name'])
+        self.file_id = interner.id(view_info['view_file_location'])
+        self.error_id = interner.id(view_info['syntax_error'])
+
+class ExploreRecord(_Record):
+    __slots__ = ('name_id', 'file_id', 'source_ids', 'error_id', 'is_endpoint_explore')
+
+    explore_name = _interned('name_id')
+    explore_file_location = _interned('file_id')
+    syntax_error = _interned('error_id')
+
+    def __init__(self, interner, explore_info):
+        self.interner = interner
+        self.name_id = interner.id(explore_info['explore_name'])
+        self.file_id = interner.id(explore_info['explore_file_location'])
+        self.source_ids = interner.ids_of(explore_info['view_sources'])
+        self.error_id = interner.id(explore_info['syntax_error'])
+        self.is_endpoint_explore = None
+
+    @property
+    def view_sources(self):
+        strings = self.interner.strings
+        return [strings[source_id] for source_id in self.source_ids]
+
+def _view_column(column):
+    return property(lambda record: getattr(record.view, column))
+
+class DerivedViewRecord(_Record):
+    '''an explore-derived view joined to one file that defines its source explore (explore_file None when none does)'''
+    __slots__ = ('view', 'explore_name_id', 'explore_file_id')
+
+    view_name = _view_column('view_name')
+    view_type = _view_column('view_type')
+    view_source_type = _view_column('view_source_type')
+    view_source_name = _view_column('view_source_name')
+    view_file_location = _view_column('view_file_location')
+    syntax_error = _view_column('syntax_error')
+    explore_name = _interned('explore_name_id')
+    explore_file_location = _interned('explore_file_id')
+
+    def __init__(self, view, explore_file):
+        self.interner = view.interner
+        self.view = view
+        self.explore_name_id = view.source_name_id if explore_file is not None else 0
+        self.explore_file_id = view.interner.id(explore_file)
+
+def to_records(interner, views_info, explores_info):
+    '''parse_file rows -> (ViewRecords, ExploreRecords)'''
+    return [ViewRecord(interner, view_info) for view_info in views_info], [ExploreRecord(interner, explore_info) for explore_info in explores_info]
+
+def write_csv(filename, columns, rows, index=None):
+    '''rows may be any iterable, so generators are written as they produce rows'''
+    if index is None:
+        index = count()
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator=os.linesep)
+        writer.writerow([''] + columns)
+        for i, row in zip(index, rows):
+            values = [row.get(column) for column in columns]
+            writer.writerow([i] + ['' if value is None else value for value in values])
+
+def sorted_with_index(rows, columns):
+    '''(original positions, rows) sorted on columns with None last, as DataFrame.sort_values does'''
+    keys = [[row.get(column) for column in columns] for row in rows]
+    order = sorted(range(len(rows)), key=lambda i: tuple((value is None, value or '') for value in keys[i]))
+    return order, [rows[i] for i in order]
+
+def build_tables(views_info, explores_info):
     '''
     find file dependencies: cross reference explores-views and views-explores
 
-    1. in views_df, if view references an explore, reference the explore model file name
+    1. in views_table, if view references an explore, reference the explore model file name
     * for each view file, list model files that need to be included
     * for each model file, list view files that need to be included
      
     '''
 
-    views_derived_explore = views_df.loc[(views_df['view_type'] == 'derived_table') & (views_df['view_source_type'] == 'explore')]
-    views_derived_sql = views_df.loc[(views_df['view_type'] == 'derived_table') & (views_df['view_source_type'] == 'sql')]
-    views_sql = views_df.loc[(views_df['view_type'] == 'sql_table')]
+    views_table = views_info
+    explores_table = explores_info
 
-    views_derived_explore_join = pd.merge(views_derived_explore, explores_df[['explore_name', 'explore_file_location']], left_on='view_source_name', right_on='explore_name', how='left')
+    views_derived_explore_join = join_derived_views(views_table, explores_table)
+    write_views(views_table)
+    write_derived_views(views_derived_explore_join)
 
-    views_df = views_df[['view_name', 'view_type', 'view_source_type', 'view_source_name', 'view_file_location', 'syntax_error']]
-    explores_df = explores_df[['explore_name', 'explore_file_location', 'view_sources', 'syntax_error']]
-    views_derived_explore_join = views_derived_explore_join[['view_name', 'view_type', 'view_source_type', 'view_source_name', 'view_file_location', 'explore_name', 'explore_file_location', 'syntax_error']]
+    return views_table, explores_table, views_derived_explore_join
 
-    views_df.sort_values(by=['view_type', 'view_source_type', 'view_name']).to_csv('views.csv')
+VIEW_SORT_COLUMNS = ['view_type', 'view_source_type', 'view_name']
 
-    views_derived_explore_join.sort_values(by=['view_type', 'view_source_type', 'view_name']).to_csv('explore_derived_views.csv')
+def join_derived_views(views_table, explores_table):
+    '''one DerivedViewRecord per explore-derived view and file that defines its source explore'''
+    explore_files_by_name = {}
+    for explore in explores_table:
+        explore_files_by_name.setdefault(explore['explore_name'], []).append(explore['explore_file_location'])
 
+    views_derived_explore_join = []
+    for view in views_table:
+        if not is_explore_derived(view):
+            continue
+        for explore_file in explore_files_by_name.get(view['view_source_name'], [None]):
+            views_derived_explore_join.append(DerivedViewRecord(view, explore_file))
+    return views_derived_explore_join
 
-    view_includes = views_derived_explore_join.groupby('view_file_location')['explore_file_location'].apply(list).to_frame()
-    view_includes = view_includes.reset_index()
-    view_includes['explore_file_location'].apply(set).to_frame()
-    view_includes['explore_file_location'].apply(list).to_frame()
-    view_includes.to_csv('view_includes.csv')
+def write_views(views_table):
+    index, rows = sorted_with_index(views_table, VIEW_SORT_COLUMNS)
+    write_csv('views.csv', VIEW_COLUMNS, rows, index)
 
-    model_includes_raw = explores_df.groupby('explore_file_location')['view_sources'].apply(list).to_frame()
-    model_includes_raw = model_includes_raw.reset_index()
-    model_includes_raw = model_includes_raw.assign(view_sources=model_includes_raw.view_sources.apply(np.concatenate))
-    model_includes_raw['view_sources'].apply(set).to_frame()
-    model_includes_raw['view_sources'].apply(list).to_frame()
-    model_includes_df = model_includes_raw.view_sources.apply(pd.Series).merge(model_includes_raw, left_index = True, right_index = True).drop(['view_sources'], axis = 1).melt(id_vars = ['explore_file_location'], value_name = 'view_sources').drop("variable", axis = 1).dropna()
-    model_includes_df_join = pd.merge(model_includes_df, views_df[['view_name', 'view_file_location']], left_on='view_sources', right_on='view_name', how='left')
-    model_includes = model_includes_df_join.groupby('explore_file_location')['view_file_location'].apply(list).to_frame()
-    model_includes = model_includes.reset_index()
-    model_includes.to_csv('model_includes.csv')
+def write_derived_views(views_derived_explore_join):
+    index, rows = sorted_with_index(views_derived_explore_join, VIEW_SORT_COLUMNS)
+    write_csv('explore_derived_views.csv', EXPLORE_DERIVED_VIEW_COLUMNS, rows, index)
 
+def build_includes(views_table, explores_table, views_derived_explore_join, output_format='csv', include_index=None):
     '''
-    find explores that are not referenced by any views; these are the end points
-        explores names in `explores_df` that are not in `views_derived_explore_join`
+    each file lists every include once, in the order it was first referenced; IncludeIndex keeps the
+    rows per file so --watch can refresh them one file at a time.
+    output_format other than csv also writes the normalized tables once the endpoint explores are flagged.
+    include_index, when given, is filled instead of a new one so the caller can reuse its rows
     '''
 
-    explores_names = list(explores_df['explore_name'])
-    referenced_explore_names = list(views_derived_explore_join['explore_name'].unique())
+    if include_index is None:
+        include_index = IncludeIndex()
+    include_index.load(views_table, explores_table)
+    include_index.write()
+
+    explores_table = flag_endpoint_explores(explores_table, views_derived_explore_join)
+    write_tables(output_format, views_table, explores_table, include_index)
+    return explores_table
 
-    endpoint_explores = []
-    for explore_name in explores_names:
-        if explore_name not in referenced_explore_names:
-            endpoint_explores.append(explore_name)
+def flag_endpoint_explores(explores_table, views_derived_explore_join):
+    '''
+    find explores that are not referenced by any views; these are the end points
+        explores names in `explores_table` that are not in `views_derived_explore_join`
+    '''
 
-    explores_df['is_endpoint_explore'] = False
+    mark_endpoint_explores(explores_table, views_derived_explore_join)
+    write_explores(explores_table)
+
+    return explores_table
+
+def mark_endpoint_explores(explores_table, views_derived_explore_join):
+    '''sets is_endpoint_explore on every explore; returns whether any flag changed'''
+    referenced_explore_names = {row['explore_name'] for row in views_derived_explore_join if row['explore_name'] is not None}
+    changed = False
+    for explore in explores_table:
+        is_endpoint_explore = explore['explore_name'] not in referenced_explore_names
+        changed = changed or explore.is_endpoint_explore is not is_endpoint_explore
+        explore.is_endpoint_explore = is_endpoint_explore
+    return changed
+
+def write_explores(explores_table):
+    write_csv('explores.csv', EXPLORE_COLUMNS + ['is_endpoint_explore'], explores_table)
+
+DECLARED_INCLUDES_FILE = 'declared_includes.csv'
+DECLARED_INCLUDE_COLUMNS = ['file_location', 'include_pattern', 'include_file_location']
+DECLARED_INCLUDE_SUMMARY_COLUMNS = ['file_location', 'include_pattern', 'matched_files']
+
+def resolve_declared_includes(path_index, includes):
+    '''yields one row per file an include: pattern matches, in file and pattern order; a pattern that matches nothing gets one row without a file'''
+    for lookml_file, patterns in includes.items():
+        for pattern in patterns:
+            for include_file in path_index.resolve(pattern, lookml_file) or [None]:
+                yield {'file_location': lookml_file, 'include_pattern': pattern, 'include_file_location': include_file}
+
+def summarize_declared_includes(path_index, includes):
+    '''yields one row per include: pattern with the number of files it matches, in file and pattern order'''
+    for lookml_file, patterns in includes.items():
+        for pattern in patterns:
+            yield {'file_location': lookml_file, 'include_pattern': pattern, 'matched_files': len(path_index.resolve(pattern, lookml_file))}
+
+def write_declared_includes(path_index, includes, expand=False):
+    '''
+    one row per include: pattern by default; expand writes one row per matched file instead, which is
+    every model times every view for the common include: "*.view.lkml"
+    '''
+    if expand:
+        write_csv(DECLARED_INCLUDES_FILE, DECLARED_INCLUDE_COLUMNS, resolve_declared_includes(path_index, includes))
+    else:
+        write_csv(DECLARED_INCLUDES_FILE, DECLARED_INCLUDE_SUMMARY_COLUMNS, summarize_declared_includes(path_index, includes))
 
-    for i, row in explores_df.iterrows():
-        if row['explore_name'] in endpoint_explores:
-            explores_df.at[i, 'is_endpoint_explore'] = True
+'''
+minimal include sets
+
+--minimal-includes treats the rows of view_includes.csv/model_includes.csv as a file dependency graph and finds,
+for every file, the files it reaches transitively as a bitset (a python int with one bit per file), filled in one
+pass over the strongly connected components in reverse topological order. LookML includes are transitive, so a
+dependency that another dependency of the same file already reaches needs no include of its own; the rest form
+the minimal include set. the resolved include: patterns are closed the same way to flag what is missing or redundant:
+    declared    in the minimal set and included directly
+    transitive  in the minimal set and reached through covered_by, which is included directly
+    missing     in the minimal set and not reached by any include
+    redundant   included directly but not in the minimal set; covered_by is the minimal include that already
+                reaches it, empty when the file needs nothing from it
+'''
 
-    explores_df.to_csv('explores.csv')
+MINIMAL_INCLUDES_FILE = 'minimal_includes.csv'
+MINIMAL_INCLUDE_COLUMNS = ['file_location', 'include_file_location', 'status', 'covered_by']
 
+def reachability(nodes, successors):
+    '''
+    bit i stands for nodes[i]; returns (node -> bit, node -> bitset of every node reachable from it,
+    node -> strongly connected component number). a node only reaches itself through a cycle
+    '''
+    position = {node: i for i, node in enumerate(nodes)}
+    bit = {node: 1 << i for i, node in enumerate(nodes)}
+    reach = {}
+    component_of = {}
+    for i, component in enumerate(strongly_connected_components(nodes, successors)):
+        members = set(component)
+        direct = bytearray((len(nodes) + 7) // 8)
+        reached = 0
+        for node in component:
+            component_of[node] = i
+            for successor in successors(node):
+                direct[position[successor] >> 3] |= 1 << (position[successor] & 7)
+                if successor not in members and reach[successor]:
+                    reached |= reach[successor]
+        reached |= int.from_bytes(direct, 'little')
+        for node in component:
+            reach[node] = reached
+    return bit, reach, component_of
+
+def _has_bit(bits_bytes, i):
+    '''bit i of a bitset already converted with to_bytes(..., 'little'); constant time, unlike bits & (1 << i)'''
+    return bits_bytes[i >> 3] >> (i & 7) & 1
+
+def minimal_include_rows(include_index, path_index, includes):
+    '''yields the rows of MINIMAL_INCLUDES_FILE in file order'''
+    dependencies = {}
+    for rows in (include_index.view_includes, include_index.model_includes):
+        for lookml_file, include_files in rows.items():
+            dependencies.setdefault(lookml_file, []).extend(include_files)
+    declared = {}
+    for row in resolve_declared_includes(path_index, includes):
+        if row['include_file_location'] is not None and row['include_file_location'] != row['file_location']:
+            declared.setdefault(row['file_location'], {})[row['include_file_location']] = None
+
+    files = sorted(include_index.file_order, key=include_index.file_order.get)
+    for lookml_file, include_files in list(declared.items()) + list(dependencies.items()):
+        files.append(lookml_file)
+        files.extend(include_files)
+    files = list(dict.fromkeys(files))
+    position = {lookml_file: i for i, lookml_file in enumerate(files)}
+    size = (len(files) + 7) // 8
+
+    bit, required, component_of = reachability(files, lambda lookml_file: dependencies.get(lookml_file, ()))
+    _, included, _ = reachability(files, lambda lookml_file: declared.get(lookml_file, ()))
+
+    reach_sizes = {}
+    def reach_size(dependency):
+        if dependency not in reach_sizes:
+            reach_sizes[dependency] = bin(required[dependency]).count('1')
+        return reach_sizes[dependency]
+
+    for lookml_file in files:
+        direct = declared.get(lookml_file, {})
+        if lookml_file not in dependencies and not direct:
+            continue
+
+        def covers(dependency):
+            '''a dependency in the same cycle as lookml_file only reaches the rest through lookml_file itself'''
+            if component_of[dependency] == component_of[lookml_file]:
+                return bit[dependency]
+            return bit[dependency] | required[dependency]
+
+        minimal = []
+        covered = 0
+        candidates = [dependency for dependency in dict.fromkeys(dependencies.get(lookml_file, ())) if dependency != lookml_file]
+        for dependency in sorted(candidates, key=lambda dependency: 0 if component_of[dependency] == component_of[lookml_file] else -reach_size(dependency)):
+            if not covered & bit[dependency]:
+                minimal.append(dependency)
+                covered |= covers(dependency)
+
+        for dependency in sorted(minimal, key=position.get):
+            covered_by = None
+            if dependency in direct:
+                status = 'declared'
+            elif included[lookml_file] & bit[dependency]:
+                status = 'transitive'
+                covered_by = next(include_file for include_file in direct if (bit[include_file] | included[include_file]) & bit[dependency])
+            else:
+                status = 'missing'
+            yield {'file_location': lookml_file, 'include_file_location': dependency, 'status': status, 'covered_by': covered_by}
+
+        coverage = [(dependency, covers(dependency).to_bytes(size, 'little')) for dependency in minimal]
+        covered = covered.to_bytes(size, 'little')
+        minimal_files = set(minimal)
+        for include_file in direct:
+            if include_file in minimal_files:
+                continue
+            i = position[include_file]
+            covered_by = None
+            if _has_bit(covered, i):
+                covered_by = next(dependency for dependency, dependency_covers in coverage if _has_bit(dependency_covers, i))
+            yield {'file_location': lookml_file, 'include_file_location': include_file, 'status': 'redundant', 'covered_by': covered_by}
+
+def write_minimal_includes(include_index, path_index, includes):
+    write_csv(MINIMAL_INCLUDES_FILE, MINIMAL_INCLUDE_COLUMNS, minimal_include_rows(include_index, path_index, includes))
+
+def tree_roots(explores_table):
+    '''names of the explores that get a tree: every endpoint explore, plus report_systems in marketing.model.lkml'''
+    return [explore['explore_name'] for explore in explores_table if explore['is_endpoint_explore'] or (explore['explore_name'] == 'report_systems' and explore['explore_file_location'] == 'marketing.model.lkml')]
+
+def build_trees(views_table, explores_table, tree_stats=None, graph=None, explore_names=None):
     '''
     1. for endpoint explores, list supporting views
     2. for views in 1, list supporting explores, if applicable, if not, list origin source
     3. for explores in 2, if any, list supporting views
     4. for views in 3, list supporting explores, if applicable, and if not, list origin source
     5. repeat until all view sources are origin sources
+
+    tree_stats, when given, collects the parse_sources counts of every endpoint explore.
+    graph and explore_names let --watch reuse its graph and rebuild only some of the trees
     '''
 
-    end_explores_list = explores_df[(explores_df.is_endpoint_explore == True) | ((explores_df.explore_name == 'report_systems') & (explores_df.explore_file_location == 'marketing.model.lkml'))][['explore_name', 'view_sources']].to_dict(orient='records')
-    #end_explores_list = explores_df[(explores_df.explore_name == 'report_systems') & (explores_df.explore_file_location == 'marketing.model.lkml')][['explore_name', 'view_sources']].to_dict(orient='records')
+    if explore_names is None:
+        explore_names = tree_roots(explores_table)
+    if graph is None:
+        graph = LineageGraph.from_tables(views_table, explores_table)
+
+    write_circular_references(graph)
+
+    memo = {}
     end_explores_info = []
-    for end_explore in end_explores_list:
-        explore_info = {}
-        explore_views = end_explore['view_sources']
-        explore_views_info = []
-        for explore_view in explore_views:
-            recursion_cache = []
-            recursion_cache.append((end_explore['explore_name'] + 'explore', explore_view + 'view'))
-            explore_view_info = parse_sources(explore_view, 'view', views_df, explores_df, recursion_cache)
-            explore_views_info.append(explore_view_info)
-        explore_info['name'] = end_explore['explore_name']
-        explore_info['type'] = 'explore'
-        explore_info['children'] = explore_views_info
-        end_explores_info.append(explore_info)
+    for explore_name in explore_names:
+        stats = {}
+        end_explores_info.append(parse_sources(explore_name, 'explore', graph, memo, stats))
+        if tree_stats is not None:
+            tree_stats.append(dict(explore_name=explore_name, **stats))
 
+    return end_explores_info
+
+def write_circular_references(graph):
+    '''circular references are found once over the whole graph, one row per cycle'''
+    write_csv('circular_references.csv', ['component_nodes', 'path'], graph.circular_references())
+
+'''
+normalized tables
+
+--format sqlite|jsonl|parquet also writes the records as four normalized tables, so tooling can query them
+instead of parsing the list reprs in the CSVs:
+    view         one row per view definition
+    explore      one row per explore definition
+    explore_view one row per view an explore references, in order
+    include      one row per include of view_includes.csv/model_includes.csv
+rows are generated one at a time and streamed into the writer; sqlite goes to TABLES_SQLITE_FILE,
+jsonl and parquet to one file per table in TABLES_DIR. parquet needs pyarrow, which is imported lazily
+'''
+
+OUTPUT_FORMATS = ['csv', 'sqlite', 'jsonl', 'parquet']
+TABLES_SQLITE_FILE = 'lookml_tables.sqlite'
+TABLES_DIR = 'lookml_tables'
+PARQUET_BATCH_ROWS = 10000
+
+TABLE_COLUMNS = {
+    'view': [('view_id', 'INTEGER'), ('view_name', 'TEXT'), ('view_type', 'TEXT'), ('view_source_type', 'TEXT'), ('view_source_name', 'TEXT'), ('view_file_location', 'TEXT'), ('syntax_error', 'TEXT')],
+    'explore': [('explore_id', 'INTEGER'), ('explore_name', 'TEXT'), ('explore_file_location', 'TEXT'), ('syntax_error', 'TEXT'), ('is_endpoint_explore', 'BOOLEAN')],
+    'explore_view': [('explore_id', 'INTEGER'), ('position', 'INTEGER'), ('view_name', 'TEXT')],
+    'include': [('file_location', 'TEXT'), ('file_type', 'TEXT'), ('position', 'INTEGER'), ('include_file_location', 'TEXT')],
+}
+TABLE_INDEXES = {
+    'view': ['view_name', 'view_source_name', 'view_file_location'],
+    'explore': ['explore_name', 'explore_file_location'],
+    'explore_view': ['explore_id', 'view_name'],
+    'include': ['file_location', 'include_file_location'],
+}
+
+def table_rows(views_table, explores_table, include_index):
+    '''(table, row generator) pairs; rows are tuples in TABLE_COLUMNS order'''
+    yield 'view', ((i, view['view_name'], view['view_type'], view['view_source_type'], view['view_source_name'], view['view_file_location'], view['syntax_error']) for i, view in enumerate(views_table))
+    yield 'explore', ((i, explore['explore_name'], explore['explore_file_location'], explore['syntax_error'], bool(explore['is_endpoint_explore'])) for i, explore in enumerate(explores_table))
+    yield 'explore_view', ((i, position, view_name) for i, explore in enumerate(explores_table) for position, view_name in enumerate(explore['view_sources']))
+    yield 'include', ((lookml_file, file_type, position, include_file)
+                      for file_type, rows in (('view', include_index.view_includes), ('model', include_index.model_includes))
+                      for lookml_file, includes in sorted(rows.items())
+                      for position, include_file in enumerate(includes))
+
+class SqliteTableWriter:
+    def __init__(self, filename=TABLES_SQLITE_FILE):
+        import sqlite3
+        self.filename = filename
+        if os.path.exists(filename + '.tmp'):
+            os.remove(filename + '.tmp')
+        self.connection = sqlite3.connect(filename + '.tmp')
+
+    def write(self, table, rows):
+        columns = TABLE_COLUMNS[table]
+        self.connection.execute('CREATE TABLE "' + table + '" (' + ', '.join(column + ' ' + column_type for column, column_type in columns) + ')')
+        self.connection.executemany('INSERT INTO "' + table + '" VALUES (' + ', '.join('?' for _ in columns) + ')', rows)
+        for column in TABLE_INDEXES[table]:
+            self.connection.execute('CREATE INDEX "' + table + '_' + column + '" ON "' + table + '" (' + column + ')')
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+        os.replace(self.filename + '.tmp', self.filename)
+
+class JsonlTableWriter:
+    def __init__(self, directory=TABLES_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, table, rows):
+        columns = [column for column, _ in TABLE_COLUMNS[table]]
+        with open(os.path.join(self.directory, table + '.jsonl'), 'w') as f:
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row))) + '\n')
+
+    def close(self):
+        pass
+
+class ParquetTableWriter:
+    ARROW_TYPES = {'INTEGER': 'int64', 'TEXT': 'string', 'BOOLEAN': 'bool_'}
+
+    def __init__(self, directory=TABLES_DIR):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, table, rows):
+        '''rows are buffered PARQUET_BATCH_ROWS at a time and written as one row group per batch'''
+        pa = self.pyarrow
+        columns = TABLE_COLUMNS[table]
+        schema = pa.schema([(column, getattr(pa, self.ARROW_TYPES[column_type])()) for column, column_type in columns])
+        with pa.parquet.ParquetWriter(os.path.join(self.directory, table + '.parquet'), schema) as writer:
+            batch = []
+            written = False
+            for row in rows:
+                batch.append(row)
+                if len(batch) == PARQUET_BATCH_ROWS:
+                    writer.write_table(self._to_table(batch, schema))
+                    batch = []
+                    written = True
+            if batch or not written:
+                writer.write_table(self._to_table(batch, schema))
+
+    def _to_table(self, batch, schema):
+        values = list(zip(*batch)) if batch else [() for _ in schema.names]
+        return self.pyarrow.Table.from_pydict({column: list(column_values) for column, column_values in zip(schema.names, values)}, schema=schema)
+
+    def close(self):
+        pass
+
+TABLE_WRITERS = {'sqlite': SqliteTableWriter, 'jsonl': JsonlTableWriter, 'parquet': ParquetTableWriter}
+
+def write_tables(output_format, views_table, explores_table, include_index):
+    '''streams the normalized tables for --format; csv writes nothing extra'''
+    if output_format == 'csv':
+        return
+    writer = TABLE_WRITERS[output_format]()
+    for table, rows in table_rows(views_table, explores_table, include_index):
+        writer.write(table, rows)
+    writer.close()
+
+'''
+derived table build schedule
+
+--schedule writes SCHEDULE_FILE, a rebuild plan for derived tables. a view derived from an explore depends on
+every derived table that explore reads; sql-derived tables have no known dependencies. tables are grouped into
+levels: level 0 depends on nothing, level n only on lower levels, so each level can be rebuilt concurrently once
+the previous one is done. for each level, width is the number of tables and fan_out the number of dependencies on
+them from later levels. the critical path is the longest dependency chain, first table to build first.
+derived tables in a circular reference, or depending on one, cannot be ordered and are listed as unschedulable
+'''
+
+SCHEDULE_FILE = 'schedule.json'
+SCHEDULE_VERSION = 1
+
+def build_schedule(views_table, explores_table, graph=None):
+    if graph is None:
+        graph = LineageGraph.from_tables(views_table, explores_table)
+
+    derived = {}
+    for view in views_table:
+        if view['view_type'] == 'derived_table':
+            derived.setdefault(view['view_name'], view)
+    dependencies = {}
+    for view_name, view in derived.items():
+        source_explore = view['view_source_name'] if view['view_source_type'] == 'explore' else None
+        depends_on = [source_view for source_view in graph.views_of(source_explore) if source_view in derived] if source_explore is not None else []
+        dependencies[view_name] = sorted(set(depends_on))
+
+    level = {}
+    unschedulable = {}
+    for component in strongly_connected_components(sorted(derived), dependencies.get):
+        view_name = component[0]
+        if len(component) > 1 or view_name in dependencies[view_name]:
+            for member in component:
+                unschedulable[member] = 'circular reference'
+            continue
+        blocked = [dependency for dependency in dependencies[view_name] if dependency in unschedulable]
+        if blocked:
+            unschedulable[view_name] = 'depends on ' + ', '.join(blocked)
+            continue
+        level[view_name] = 1 + max((level[dependency] for dependency in dependencies[view_name]), default=-1)
+
+    fan_out = {}
+    for view_name in level:
+        for dependency in dependencies[view_name]:
+            fan_out[dependency] = fan_out.get(dependency, 0) + 1
+
+    levels = []
+    for view_name in sorted(level, key=lambda view_name: (level[view_name], view_name)):
+        if len(levels) == level[view_name]:
+            levels.append({'level': level[view_name], 'width': 0, 'fan_out': 0, 'views': []})
+        levels[-1]['views'].append(view_name)
+        levels[-1]['width'] += 1
+        levels[-1]['fan_out'] += fan_out.get(view_name, 0)
+
+    critical_path = []
+    if levels:
+        current = levels[-1]['views'][0]
+        critical_path.append(current)
+        while level[current] > 0:
+            current = next(dependency for dependency in dependencies[current] if level[dependency] == level[current] - 1)
+            critical_path.append(current)
+        critical_path.reverse()
+
+    return {
+        'version': SCHEDULE_VERSION,
+        'derived_tables': len(derived),
+        'critical_path_length': len(critical_path),
+        'critical_path': critical_path,
+        'levels': levels,
+        'views': {view_name: {
+            'level': level.get(view_name),
+            'source_type': derived[view_name]['view_source_type'],
+            'source_name': derived[view_name]['view_source_name'],
+            'file': derived[view_name]['view_file_location'],
+            'depends_on': dependencies[view_name],
+        } for view_name in sorted(derived)},
+        'unschedulable': [{'view': view_name, 'reason': reason} for view_name, reason in sorted(unschedulable.items())],
+    }
+
+def write_schedule(schedule, schedule_file=SCHEDULE_FILE):
+    with open(schedule_file, 'w') as f:
+        json.dump(schedule, f, indent=2)
+
+'''
+shared-subtree (DAG) output
+
+--tree-format dag writes one node/edge file instead of a fully expanded tree per endpoint explore.
+every view, explore and source appears once under a stable id (type:name) and lists its children by id,
+so subtrees shared by many endpoint explores are stored once. DAG_VIEWER is copied next to it and
+expands nodes on demand in the browser
+'''
+
+DAG_FILE = 'lineage_graph.json'
+DAG_VIEWER = 'lineage_viewer.html'
+DAG_VERSION = 1
+
+def node_id(node_type, node_name):
+    return str(node_type) + ':' + str(node_name)
+
+def build_dag(views_table, explores_table, graph=None, explore_names=None):
+    '''nodes reachable from the tree roots, each with the ids of its children'''
+    if explore_names is None:
+        explore_names = tree_roots(explores_table)
+    if graph is None:
+        graph = LineageGraph.from_tables(views_table, explores_table)
+    write_circular_references(graph)
+
+    nodes = {}
+    pending = [('explore', explore_name) for explore_name in explore_names]
+    while pending:
+        node = pending.pop()
+        current_id = node_id(*node)
+        if current_id in nodes:
+            continue
+        successors = graph.successors(node)
+        if node[0] == 'view' and not successors:
+            source_name, source_type = graph.view_source(node[1])
+            source_id = node_id(source_type, source_name)
+            nodes.setdefault(source_id, {'name': source_name, 'type': source_type, 'children': []})
+            children = [source_id]
+        else:
+            children = [node_id(*successor) for successor in successors]
+            pending.extend(successor for successor in successors if node_id(*successor) not in nodes)
+        nodes[current_id] = {'name': node[1], 'type': node[0], 'children': children}
+
+    return {
+        'version': DAG_VERSION,
+        'roots': [node_id('explore', explore_name) for explore_name in explore_names],
+        'nodes': dict(sorted(nodes.items())),
+        'circular_references': graph.circular_references(),
+    }
+
+def write_dag(wd, dag, viewer=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trees', DAG_VIEWER)):
+    with open(wd + '/trees/' + DAG_FILE, 'w') as f:
+        f.write(json.dumps(dag, separators=(',', ':')))
+    with open(viewer, 'r') as f:
+        template = f.read()
+    with open(wd + '/trees/' + DAG_VIEWER, 'w') as f:
+        f.write(template.replace('lineageGraph.json', DAG_FILE))
+
+def write_trees(wd, end_explores_info, d3_template='trees/tree_template.html'):
     json_list = []
-    d3_template = 'trees/tree_template.html'
 
     for i in end_explores_info:
         filename = wd + '/trees/' + str(i['name']) + '.json'
@@ -410,74 +1472,607 @@ def generate_graphs(wd, json_list, d3_template):
             f.write(write_tree)
 
 
-def parse_sources(component, component_type, views_df, explores_df, recursion_cache):
-    recursion_cache = list(set(recursion_cache))
-    cache_extension = []
-    if len(recursion_cache) > 1:
-        for linked_item in recursion_cache:
-            front_val = linked_item[0]
-            end_val = linked_item[-1]
-            for linked_item2 in recursion_cache:
-                front_val2 = linked_item2[0]
-                end_val2 = linked_item2[-1]
-                if (front_val2 == front_val) & (end_val2 != end_val):
-                    if (end_val2, end_val) not in recursion_cache:
-                        if ((end_val2[-4:] == 'lore') & (end_val[-4:] != 'lore') or (end_val2[-4:] == 'view') & (end_val[-4:] != 'view') or (end_val2[-4:] != 'lore') & (end_val[-4:] == 'lore') or (end_val2[-4:] != 'view') & (end_val[-4:] == 'view')):
-                            cache_extension.append((end_val2, end_val))
-                if (front_val2 == end_val) & (end_val2 != front_val):
-                    if (end_val2, front_val) not in recursion_cache:
-                        if ((end_val2[-4:] == 'lore') & (front_val[-4:] != 'lore') or (end_val2[-4:] == 'view') & (
-                                front_val[-4:] != 'view') or (end_val2[-4:] != 'lore') & (front_val[-4:] == 'lore') or (
-                                end_val2[-4:] != 'view') & (front_val[-4:] == 'view')):
-                            cache_extension.append((end_val2, front_val))
-                if (end_val2 == front_val) & (front_val2 != end_val):
-                    if (front_val2, end_val) not in recursion_cache:
-                        if ((front_val2[-4:] == 'lore') & (end_val[-4:] != 'lore') or (front_val2[-4:] == 'view') & (
-                                end_val[-4:] != 'view') or (front_val2[-4:] != 'lore') & (end_val[-4:] == 'lore') or (
-                                front_val2[-4:] != 'view') & (end_val[-4:] == 'view')):
-                            cache_extension.append((front_val2, end_val))
-                if (end_val2 == end_val) & (front_val2 != front_val):
-                    if (front_val2, front_val) not in recursion_cache:
-                        if ((front_val2[-4:] == 'lore') & (front_val[-4:] != 'lore') or (front_val2[-4:] == 'view') & (
-                                front_val[-4:] != 'view') or (front_val2[-4:] != 'lore') & (front_val[-4:] == 'lore') or (
-                                front_val2[-4:] != 'view') & (front_val[-4:] == 'view')):
-                            cache_extension.append((front_val2, front_val))
-        recursion_cache.extend(cache_extension)
-    component_info = {}
-    component_info_list = []
-    component_info['name'] = component
-    component_info['type'] = component_type
-    is_origin = False
-    if component_type =='view':
-        #recursion_cache.append(component + component_type)
-        source_type = views_df['view_source_type'][views_df['view_name'] == component].to_string(index=False)
-        source_name = views_df['view_source_name'][views_df['view_name'] == component].to_string(index=False)
-        source_info = {}
-        if source_type == 'sql':
-            is_origin = True
-        source_info['name'] = source_name
-        source_info['type'] = source_type
-        #recursion_cache.append((component + component_type, source_name + source_type))
-        if is_origin == False:
-            if (component + component_type, source_name + source_type) not in recursion_cache:
-                recursion_cache.append((component + component_type, source_name + source_type))
-                component_info['children'] = [parse_sources(source_name, source_type, views_df, explores_df, recursion_cache)]
+'''
+lineage graph
+
+view -> source and explore -> views adjacency held in dicts, built once from views_table/explores_table
+so tree building looks nodes up by name instead of scanning the frames for every node.
+nodes are (type, name) tuples: ('view', name) or ('explore', name)
+'''
+
+def strongly_connected_components(nodes, successors):
+    '''iterative Tarjan over nodes and a successors(node) function; components come out in reverse topological order'''
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for start in nodes:
+        if start in index:
+            continue
+        index[start] = lowlink[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(successors(start)))]
+        while work:
+            node, node_successors = work[-1]
+            for successor in node_successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(successors(successor))))
+                    break
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
             else:
-                source_info['children'] = [{'name': 'ERROR', 'type': 'Circular Reference'}]
-                component_info['children'] = [source_info]
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    return components
+
+def reverse_adjacency(nodes, successors):
+    '''node -> the nodes listing it among their successors, in nodes order'''
+    predecessors = {}
+    for node in nodes:
+        for successor in successors(node):
+            predecessors.setdefault(successor, []).append(node)
+    return predecessors
+
+class LineageGraph:
+    def __init__(self, view_sources, explore_views):
+        self.view_sources = view_sources
+        self.explore_views = explore_views
+        self._component_of = None
+        self._components = None
+        self._predecessors = None
+
+    @classmethod
+    def from_tables(cls, views_table, explores_table):
+        '''the first definition wins when a view or explore name is declared more than once'''
+        view_sources = {}
+        for view in views_table:
+            view_sources.setdefault(view['view_name'], (str(view['view_source_name']), str(view['view_source_type'])))
+        explore_views = {}
+        for explore in explores_table:
+            explore_views.setdefault(explore['explore_name'], list(explore['view_sources']))
+        return cls(view_sources, explore_views)
+
+    def view_source(self, view_name):
+        '''(source_name, source_type) of a view; ('None', 'None') for views that were not parsed'''
+        return self.view_sources.get(view_name, ('None', 'None'))
+
+    def views_of(self, explore_name):
+        return self.explore_views.get(explore_name, [])
+
+    def nodes(self):
+        return [('view', name) for name in self.view_sources] + [('explore', name) for name in self.explore_views]
+
+    def predecessors(self):
+        '''reverse adjacency: node -> nodes that depend on it; built once, then kept current by update()'''
+        if self._predecessors is None:
+            self._predecessors = reverse_adjacency(self.nodes(), self.successors)
+        return self._predecessors
+
+    def update(self, view_sources, explore_views):
+        '''
+        replaces the entries of the given view and explore names (None removes one) and patches predecessors
+        edge by edge, so --watch never rebuilds the graph; components are recomputed when next asked for
+        '''
+        predecessors = self.predecessors()
+        for node_type, entries, table in (('view', view_sources, self.view_sources), ('explore', explore_views, self.explore_views)):
+            for name, entry in entries.items():
+                node = (node_type, name)
+                for successor in self.successors(node):
+                    predecessors[successor].remove(node)
+                if entry is None:
+                    table.pop(name, None)
+                else:
+                    table[name] = entry
+                for successor in self.successors(node):
+                    predecessors.setdefault(successor, []).append(node)
+        self._components = None
+        self._component_of = None
+
+    def ancestors(self, nodes):
+        '''the given nodes and every node whose lineage reaches one of them'''
+        predecessors = self.predecessors()
+        seen = set(nodes)
+        pending = list(seen)
+        while pending:
+            for predecessor in predecessors.get(pending.pop(), []):
+                if predecessor not in seen:
+                    seen.add(predecessor)
+                    pending.append(predecessor)
+        return seen
+
+    def successors(self, node):
+        node_type, name = node
+        if node_type == 'view':
+            source_name, source_type = self.view_source(name)
+            return [('explore', source_name)] if source_type == 'explore' else []
+        if node_type == 'explore':
+            return [('view', view_name) for view_name in self.views_of(name)]
+        return []
+
+    def strongly_connected_components(self):
+        if self._components is not None:
+            return self._components
+        components = strongly_connected_components(self.nodes(), self.successors)
+        self._components = components
+        self._component_of = {node: i for i, component in enumerate(components) for node in component}
+        return components
+
+    def component_of(self, node):
+        self.strongly_connected_components()
+        return self._component_of.get(node, node)
+
+    def circular_references(self):
+        '''one shortest cycle through the root of every strongly connected component that has a cycle'''
+        cycles = []
+        for component in self.strongly_connected_components():
+            if len(component) < 2:
+                continue
+            members = set(component)
+            start = component[-1]
+            parents = {}
+            queue = deque([start])
+            last = None
+            while queue and last is None:
+                node = queue.popleft()
+                for successor in self.successors(node):
+                    if successor == start:
+                        last = node
+                        break
+                    if successor in members and successor not in parents:
+                        parents[successor] = node
+                        queue.append(successor)
+            path = [last]
+            while path[-1] != start:
+                path.append(parents[path[-1]])
+            path.reverse()
+            path.append(start)
+            cycles.append({
+                'component_nodes': sorted(node_type + ':' + name for node_type, name in component),
+                'path': ' -> '.join(node_type + ':' + name for node_type, name in path),
+            })
+        return cycles
+
+'''
+lineage index
+
+the graph main() builds is also written to LINEAGE_INDEX_FILE so lookml_query.py can answer upstream,
+downstream and impact questions without reparsing. besides views and explores the index has
+('table', name) nodes for the sql_table_name of every sql table view
+'''
+
+LINEAGE_INDEX_FILE = 'lineage_index.json'
+LINEAGE_INDEX_VERSION = 1
+
+def write_lineage_index(views_table, explores_table, index_file=LINEAGE_INDEX_FILE):
+    views = {}
+    for view in views_table:
+        views.setdefault(view['view_name'], {'view_type': view['view_type'], 'source_type': view['view_source_type'], 'source_name': view['view_source_name'], 'file': view['view_file_location']})
+    explores = {}
+    for explore in explores_table:
+        explores.setdefault(explore['explore_name'], {'views': list(explore['view_sources']), 'file': explore['explore_file_location'], 'is_endpoint': bool(explore['is_endpoint_explore'])})
+    with open(index_file, 'w') as f:
+        f.write(json.dumps({'version': LINEAGE_INDEX_VERSION, 'views': views, 'explores': explores}))
+
+'''
+field lineage index
+
+FIELD_INDEX_FILE inverts the fields_info of every file: columns -> the fields that read them, fields -> the fields
+they reference, the view that defines them and the join sql_on that use them, views -> the explores that read
+them. columns are named after the sql_table_name of sql table views and after the view itself otherwise.
+lookml_query.py answers column:name and field:view.field queries from it the way it does for views
+'''
+
+FIELD_INDEX_FILE = 'field_index.json'
+FIELD_INDEX_VERSION = 1
+
+def write_field_index(views_table, explores_table, fields, index_file=FIELD_INDEX_FILE):
+    view_tables = {}
+    for view in views_table:
+        view_tables.setdefault(view['view_name'], view['view_source_name'] if view['view_type'] == 'sql_table' else view['view_name'])
+    views = {}
+    for explore in explores_table:
+        for view_name in explore['view_sources']:
+            explores_of_view = views.setdefault(view_name, {'explores': []})['explores']
+            if explore['explore_name'] not in explores_of_view:
+                explores_of_view.append(explore['explore_name'])
+    explores = {}
+    for explore in explores_table:
+        explores.setdefault(explore['explore_name'], {'file': explore['explore_file_location'], 'is_endpoint': bool(explore['is_endpoint_explore'])})
+
+    field_records = {}
+    columns = {}
+    for lookml_file, fields_info in fields.items():
+        for field_info in fields_info['fields']:
+            field_id = field_info['view_name'] + '.' + field_info['field_name']
+            if field_id in field_records:
+                continue
+            table = view_tables.get(field_info['view_name'], field_info['view_name'])
+            field_columns = [str(table) + '.' + column for column in field_info['columns']]
+            field_records[field_id] = {'view': field_info['view_name'], 'type': field_info['field_type'], 'file': lookml_file, 'columns': field_columns, 'references': field_info['references'], 'sql_on': []}
+            for column in field_columns:
+                columns.setdefault(column, []).append(field_id)
+    def dimension_group(field_id):
+        '''${created_date} refers to the timeframes of dimension_group: created'''
+        name = field_id
+        while name not in field_records and '_' in name.partition('.')[2]:
+            name = name.rsplit('_', 1)[0]
+        return name if name in field_records and field_records[name]['type'] == 'dimension_group' else field_id
+
+    for field_record in field_records.values():
+        field_record['references'] = list(dict.fromkeys(map(dimension_group, field_record['references'])))
+    for lookml_file, fields_info in fields.items():
+        for join_info in fields_info['joins']:
+            for field_id in map(dimension_group, join_info['references']):
+                view_name, _, field_name = field_id.partition('.')
+                field_record = field_records.setdefault(field_id, {'view': view_name, 'type': None, 'file': None, 'columns': [], 'references': [], 'sql_on': []})
+                field_record['sql_on'].append({'explore': join_info['explore_name'], 'join': join_info['join_name'], 'file': lookml_file})
+
+    with open(index_file, 'w') as f:
+        f.write(json.dumps({'version': FIELD_INDEX_VERSION, 'columns': columns, 'fields': field_records, 'views': views, 'explores': explores}))
+
+def _circular_reference(node):
+    return {'name': node[1], 'type': node[0], 'children': [{'name': 'ERROR', 'type': 'Circular Reference'}]}
+
+def _view_leaf_children(graph, view_name):
+    '''children of a view that is not sourced from an explore'''
+    source_name, source_type = graph.view_source(view_name)
+    source_info = {'name': source_name, 'type': source_type}
+    if source_type == 'sql':
+        source_info['children'] = [{'name': 'self', 'type': 'self'}]
+    return [source_info]
+
+def parse_sources(component, component_type, graph, memo=None, stats=None):
+    '''
+    expands the lineage tree below a view or explore without recursion.
+
+    an edge back to a node on the current path is cut with a Circular Reference marker.
+    the subtree of a node only depends on the path when an ancestor sits in the same strongly
+    connected component, so every node entered from another component (or as the root) is
+    memoized and shared between endpoint explores.
+
+    stats, when given, counts the nodes expanded and the memoized subtrees reused
+    '''
+    if memo is None:
+        memo = {}
+    if stats is None:
+        stats = {}
+    stats.setdefault('expanded_nodes', 0)
+    stats.setdefault('memo_hits', 0)
+    root = (component_type, component)
+    if root in memo:
+        stats['memo_hits'] += 1
+        return memo[root]
+
+    def open_frame(node, memoize):
+        stats['expanded_nodes'] += 1
+        info = {'name': node[1], 'type': node[0]}
+        successors = graph.successors(node)
+        if node[0] == 'view' and not successors:
+            info['children'] = _view_leaf_children(graph, node[1])
+        return [node, info, successors, 0, [], memoize]
+
+    stack = [open_frame(root, True)]
+    on_path = {root}
+    while True:
+        frame = stack[-1]
+        node, info, successors, position, children, memoize = frame
+        if position < len(successors):
+            frame[3] += 1
+            successor = successors[position]
+            crosses_component = graph.component_of(successor) != graph.component_of(node)
+            if successor in on_path:
+                children.append(_circular_reference(successor))
+            elif crosses_component and successor in memo:
+                stats['memo_hits'] += 1
+                children.append(memo[successor])
+            else:
+                on_path.add(successor)
+                stack.append(open_frame(successor, crosses_component))
+            continue
+
+        if 'children' not in info:
+            info['children'] = children
+        stack.pop()
+        on_path.discard(node)
+        if memoize:
+            memo[node] = info
+        if not stack:
+            return info
+        stack[-1][4].append(info)
+
+'''
+watch mode
+
+after a full run, --watch keeps the parsed records, include rows and lineage graph in memory and polls the
+working directory every WATCH_INTERVAL seconds. only files whose mtime or size changed are reparsed, only the
+include rows that reference names defined in those files are recomputed, and only the trees of endpoint
+explores whose lineage reaches a changed view or explore are rewritten
+'''
+
+WATCH_INTERVAL = 0.5
+
+def is_explore_derived(view_info):
+    return view_info['view_type'] == 'derived_table' and view_info['view_source_type'] == 'explore'
+
+class IncludeIndex:
+    '''
+    view_includes/model_includes rows kept per file, with name -> file indexes in both directions,
+    so replacing one file's records only recomputes the rows that reference names it defines.
+    rows match build_includes
+    '''
+    def __init__(self):
+        self.file_order = {}
+        self.views_by_file = {}
+        self.explores_by_file = {}
+        self.view_files_by_name = {}
+        self.explore_files_by_name = {}
+        self.files_referencing_view = {}
+        self.files_referencing_explore = {}
+        self.view_includes = {}
+        self.model_includes = {}
+
+    def load(self, views_info, explores_info):
+        for view_info in views_info:
+            self.views_by_file.setdefault(view_info['view_file_location'], []).append(view_info)
+        for explore_info in explores_info:
+            self.explores_by_file.setdefault(explore_info['explore_file_location'], []).append(explore_info)
+        for lookml_file in list(self.views_by_file) + list(self.explores_by_file):
+            self.file_order.setdefault(lookml_file, len(self.file_order))
+        for lookml_file in self.file_order:
+            self._index(lookml_file, add=True)
+        for lookml_file in self.file_order:
+            self._refresh(lookml_file)
+
+    def update(self, lookml_file, views_info, explores_info):
+        '''
+        replaces the records of one file (None for a deleted file);
+        returns the view and explore names the file defined before or after the change
+        '''
+        self._index(lookml_file, add=False)
+        old_views = self.views_by_file.pop(lookml_file, [])
+        old_explores = self.explores_by_file.pop(lookml_file, [])
+        if views_info:
+            self.views_by_file[lookml_file] = views_info
+        if explores_info:
+            self.explores_by_file[lookml_file] = explores_info
+        if views_info is None and explores_info is None:
+            self.file_order.pop(lookml_file, None)
         else:
-            source_info['children'] = [{'name': 'self', 'type': 'self'}]
-            component_info['children'] = [source_info]
-    elif component_type == 'explore':
-        view_names = explores_df['view_sources'][explores_df['explore_name'] == component].values.tolist()[0]
-        view_info_list = []
+            self.file_order.setdefault(lookml_file, max(self.file_order.values(), default=-1) + 1)
+        self._index(lookml_file, add=True)
+
+        view_names = {view_info['view_name'] for view_info in old_views + (views_info or [])}
+        explore_names = {explore_info['explore_name'] for explore_info in old_explores + (explores_info or [])}
+
+        stale_files = {lookml_file}
+        for view_name in view_names:
+            stale_files.update(self.files_referencing_view.get(view_name, ()))
+        for explore_name in explore_names:
+            stale_files.update(self.files_referencing_explore.get(explore_name, ()))
+        for stale_file in stale_files:
+            self._refresh(stale_file)
+
+        return view_names, explore_names
+
+    def definitions(self, view_names, explore_names):
+        '''
+        LineageGraph entries of the given names, taken from the first file that defines each (as from_tables does);
+        None for a name that is no longer defined
+        '''
+        view_sources = {}
         for view_name in view_names:
-            recursion_cache.append((component + component_type, view_name + 'view'))
-            view_info = parse_sources(view_name, 'view', views_df, explores_df, recursion_cache)
-            view_info_list.append(view_info)
-        component_info['children'] = view_info_list
- 
-    return component_info
+            view_sources[view_name] = None
+            for lookml_file in self._ordered(self.view_files_by_name.get(view_name, ())):
+                view = next(view for view in self.views_by_file[lookml_file] if view['view_name'] == view_name)
+                view_sources[view_name] = (str(view['view_source_name']), str(view['view_source_type']))
+                break
+        explore_views = {}
+        for explore_name in explore_names:
+            explore_views[explore_name] = None
+            for lookml_file in self._ordered(self.explore_files_by_name.get(explore_name, ())):
+                explore = next(explore for explore in self.explores_by_file[lookml_file] if explore['explore_name'] == explore_name)
+                explore_views[explore_name] = list(explore['view_sources'])
+                break
+        return view_sources, explore_views
+
+    def records(self):
+        '''views_info and explores_info in file order, as parse_all_files returns them'''
+        ordered_files = sorted(self.file_order, key=self.file_order.get)
+        views_info = [view_info for lookml_file in ordered_files for view_info in self.views_by_file.get(lookml_file, [])]
+        explores_info = [explore_info for lookml_file in ordered_files for explore_info in self.explores_by_file.get(lookml_file, [])]
+        return views_info, explores_info
+
+    def write(self):
+        write_csv('view_includes.csv', ['view_file_location', 'explore_file_location'], [{'view_file_location': lookml_file, 'explore_file_location': includes} for lookml_file, includes in sorted(self.view_includes.items())])
+        write_csv('model_includes.csv', ['explore_file_location', 'view_file_location'], [{'explore_file_location': lookml_file, 'view_file_location': includes} for lookml_file, includes in sorted(self.model_includes.items())])
+
+    def _index(self, lookml_file, add):
+        def apply(index, name):
+            files = index.setdefault(name, set())
+            if add:
+                files.add(lookml_file)
+            else:
+                files.discard(lookml_file)
+
+        for view_info in self.views_by_file.get(lookml_file, []):
+            apply(self.view_files_by_name, view_info['view_name'])
+            if is_explore_derived(view_info):
+                apply(self.files_referencing_explore, view_info['view_source_name'])
+        for explore_info in self.explores_by_file.get(lookml_file, []):
+            apply(self.explore_files_by_name, explore_info['explore_name'])
+            for view_name in explore_info['view_sources']:
+                apply(self.files_referencing_view, view_name)
+
+    def _ordered(self, files):
+        return sorted(files, key=self.file_order.get)
+
+    def _refresh(self, lookml_file):
+        view_includes = []
+        for view_info in self.views_by_file.get(lookml_file, []):
+            if is_explore_derived(view_info):
+                view_includes.extend(self._ordered(self.explore_files_by_name.get(view_info['view_source_name'], ())))
+        model_includes = []
+        for explore_info in self.explores_by_file.get(lookml_file, []):
+            for view_name in explore_info['view_sources']:
+                model_includes.extend(self._ordered(self.view_files_by_name.get(view_name, ())))
+
+        for rows, includes in ((self.view_includes, view_includes), (self.model_includes, model_includes)):
+            if includes:
+                rows[lookml_file] = list(dict.fromkeys(includes))
+            else:
+                rows.pop(lookml_file, None)
+
+def snapshot_files(path_index=None):
+    '''(file_type, mtime, size) of every view and model file in path_index (a fresh scan of the current directory by default)'''
+    if path_index is None:
+        path_index = PathIndex.scan('.')
+    snapshot = {}
+    for lookml_files, file_type in ((path_index.view_files, 'view'), (path_index.model_files, 'model')):
+        for lookml_file in lookml_files:
+            try:
+                stat = os.stat(lookml_file)
+            except OSError:
+                continue
+            snapshot[lookml_file] = (file_type, stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+def _rows(records, columns):
+    return [[record[column] for column in columns] for record in records or ()]
+
+def watch(wd, views_info, explores_info, interner, includes, fields, tree_format='tree', output_format='csv', minimal_includes=False, schedule=False, declared_include_files=False, snapshot=None, interval=WATCH_INTERVAL):
+    '''
+    views_info, explores_info, includes and fields are the records, include: patterns and fields_info of the full run,
+    with endpoint explores already flagged (fields is None without --field-index). FIELD_INDEX_FILE is only rewritten
+    when a changed file's fields or join sql_on changed, or the lineage did; reparsed files are interned in interner. snapshot is the snapshot_files
+    taken before the full run read any file, so edits made while it ran are picked up on the first poll.
+    a file whose view and explore rows come back unchanged (a comment, a dimension) leaves the lineage outputs alone;
+    otherwise the graph and its predecessors are patched for the names the file defines instead of being rebuilt.
+    DECLARED_INCLUDES_FILE is only rewritten when a file's include: patterns change or files are added or removed
+    '''
+    index = IncludeIndex()
+    index.load(views_info, explores_info)
+    path_index = PathIndex.scan('.')
+    paths = set(path_index.paths)
+    if snapshot is None:
+        snapshot = snapshot_files(path_index)
+    graph = LineageGraph.from_tables(views_info, explores_info)
+    graph.predecessors()
+    roots = set(tree_roots(explores_info))
+    print('watching ' + wd + ' for changes (ctrl-c to stop)')
+
+    while True:
+        time.sleep(interval)
+        path_index = PathIndex.scan('.')
+        current = snapshot_files(path_index)
+        changed_files = [lookml_file for lookml_file in current if snapshot.get(lookml_file) != current[lookml_file]]
+        deleted_files = [lookml_file for lookml_file in snapshot if lookml_file not in current]
+        snapshot = current
+        includes_changed = paths != set(path_index.paths)
+        paths = set(path_index.paths)
+        if not changed_files and not deleted_files:
+            if includes_changed:
+                write_declared_includes(path_index, includes, declared_include_files)
+                if minimal_includes:
+                    write_minimal_includes(index, path_index, includes)
+            continue
+
+        start = time.perf_counter()
+        changed_views = set()
+        changed_explores = set()
+        views_changed = False
+        explores_changed = False
+        fields_changed = False
+        for lookml_file in changed_files + deleted_files:
+            old_includes = includes.pop(lookml_file, None)
+            old_fields = fields.pop(lookml_file, None) if fields is not None else None
+            if lookml_file in current:
+                file_views_info, file_explores_info, file_includes, file_fields, _ = parse_file(lookml_file, current[lookml_file][0], fields is not None)
+                if file_includes:
+                    includes[lookml_file] = file_includes
+                includes_changed = includes_changed or (file_includes or None) != old_includes
+                if file_fields is not None and not (file_fields['fields'] or file_fields['joins']):
+                    file_fields = None
+                if fields is not None and file_fields is not None:
+                    fields[lookml_file] = file_fields
+                fields_changed = fields_changed or (fields is not None and file_fields != old_fields)
+                file_views_changed = _rows(file_views_info, VIEW_COLUMNS) != _rows(index.views_by_file.get(lookml_file), VIEW_COLUMNS)
+                file_explores_changed = _rows(file_explores_info, EXPLORE_COLUMNS) != _rows(index.explores_by_file.get(lookml_file), EXPLORE_COLUMNS)
+                if lookml_file in index.file_order and not file_views_changed and not file_explores_changed:
+                    continue
+                file_views_info, file_explores_info = to_records(interner, file_views_info, file_explores_info)
+            else:
+                fields_changed = fields_changed or old_fields is not None
+                file_views_changed = lookml_file in index.views_by_file
+                file_explores_changed = lookml_file in index.explores_by_file
+                file_views_info, file_explores_info = None, None
+            views_changed = views_changed or file_views_changed
+            explores_changed = explores_changed or file_explores_changed
+            view_names, explore_names = index.update(lookml_file, file_views_info, file_explores_info)
+            changed_views.update(view_names)
+            changed_explores.update(explore_names)
+        if includes_changed:
+            write_declared_includes(path_index, includes, declared_include_files)
+
+        if not changed_views and not changed_explores:
+            if includes_changed and minimal_includes:
+                write_minimal_includes(index, path_index, includes)
+            if fields_changed:
+                write_field_index(*index.records(), fields)
+            print('reparsed ' + str(len(changed_files) + len(deleted_files)) + ' file(s), lineage unchanged in ' + str(round(time.perf_counter() - start, 3)) + 's')
+            continue
+
+        index.write()
+        if minimal_includes:
+            write_minimal_includes(index, path_index, includes)
+        graph.update(*index.definitions(changed_views, changed_explores))
+
+        '''only the CSVs whose rows can have changed are rewritten'''
+        views_table, explores_table = index.records()
+        views_derived_explore_join = join_derived_views(views_table, explores_table)
+        if views_changed:
+            write_views(views_table)
+            write_derived_views(views_derived_explore_join)
+        elif explores_changed:
+            write_derived_views(views_derived_explore_join)
+        if mark_endpoint_explores(explores_table, views_derived_explore_join) or explores_changed:
+            write_explores(explores_table)
+        write_tables(output_format, views_table, explores_table, index)
+        write_lineage_index(views_table, explores_table)
+        if fields is not None:
+            write_field_index(views_table, explores_table, fields)
+        if schedule:
+            write_schedule(build_schedule(views_table, explores_table, graph))
+        current_roots = tree_roots(explores_table)
+        if tree_format == 'dag':
+            roots = set(current_roots)
+            write_dag(wd, build_dag(views_table, explores_table, graph, current_roots))
+            print('reparsed ' + str(len(changed_files) + len(deleted_files)) + ' file(s), rewrote ' + DAG_FILE + ' in ' + str(round(time.perf_counter() - start, 3)) + 's')
+            continue
+        changed_nodes = {('view', view_name) for view_name in changed_views} | {('explore', explore_name) for explore_name in changed_explores}
+        affected = graph.ancestors(changed_nodes)
+        rebuild = [explore_name for explore_name in current_roots if ('explore', explore_name) in affected or explore_name not in roots]
+        roots = set(current_roots)
+        write_trees(wd, build_trees(views_table, explores_table, graph=graph, explore_names=rebuild))
+
+        print('reparsed ' + str(len(changed_files) + len(deleted_files)) + ' file(s), rewrote ' + str(len(rebuild)) + ' tree(s) in ' + str(round(time.perf_counter() - start, 3)) + 's')
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,237 @@
+import argparse, os, json, sys
+
+import lookml_parser
+
+'''
+Call query with: [python lookml_query.py -wd 'LookML repository' <upstream|downstream|impact> <node> [--depth N] [--format json|text]]
+Answers lineage questions from the lineage_index.json written by lookml_parser.py, without reparsing:
+1. upstream: everything a view, explore or table depends on
+2. downstream: everything that depends on it
+3. impact: downstream, plus the endpoint explores and files that would need checking
+
+Nodes are given as view:name, explore:name or table:schema.table; a bare name is looked up as a view,
+then an explore, then a table. field:view.field and column:table.column nodes are answered from the
+field_index.json instead; their impact also lists the views, explores and join sql_on that use them
+'''
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-wd', '--working-directory', help='LookML directory that lookml_parser.py was run on', dest='wd', default='.')
+    parser.add_argument('--index', help='lineage index file (default: ' + lookml_parser.LINEAGE_INDEX_FILE + ', or ' + lookml_parser.FIELD_INDEX_FILE + ' for field and column nodes, in the working directory)', default=None)
+    parser.add_argument('--depth', help='stop after this many edges', type=int, default=None)
+    parser.add_argument('--format', help='output format', choices=['json', 'text'], default='text')
+    parser.add_argument('command', choices=['upstream', 'downstream', 'impact'])
+    parser.add_argument('node', help='view:name, explore:name, table:name, field:view.field, column:table.column or a bare name')
+    args = parser.parse_args()
+    return args
+
+'''
+lineage index
+
+LineageIndex answers upstream, downstream and impact questions from the lookml_parser.LINEAGE_INDEX_FILE written
+by lookml_parser.write_lineage_index, and FieldIndex answers field and column questions from the
+lookml_parser.FIELD_INDEX_FILE of write_field_index. downstream walks the reverse adjacency of the index's nodes
+'''
+
+NODE_TYPES = ('view', 'explore', 'table')
+FIELD_NODE_TYPES = ('field', 'column')
+
+class LineageIndex:
+    def __init__(self, views, explores):
+        self.views = views
+        self.explores = explores
+        self.graph = lookml_parser.LineageGraph(
+            {view_name: (str(view['source_name']), str(view['source_type'])) for view_name, view in views.items()},
+            {explore_name: explore['views'] for explore_name, explore in explores.items()},
+        )
+        self._predecessors = None
+
+    @classmethod
+    def load(cls, index_file=lookml_parser.LINEAGE_INDEX_FILE):
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        if index.get('version') != lookml_parser.LINEAGE_INDEX_VERSION:
+            raise ValueError(index_file + ' was written by another version of lookml_parser.py; rerun the parser')
+        return cls(index['views'], index['explores'])
+
+    def resolve(self, name):
+        '''accepts type:name, or a bare name that is looked up as a view, then an explore, then a table'''
+        node_type, _, node_name = name.partition(':')
+        if node_name and node_type in NODE_TYPES:
+            return node_type, node_name
+        if name in self.views:
+            return 'view', name
+        if name in self.explores:
+            return 'explore', name
+        return 'table', name
+
+    def successors(self, node):
+        if node[0] == 'view':
+            view = self.views.get(node[1])
+            if view is not None and view['view_type'] == 'sql_table':
+                return [('table', view['source_name'])]
+        return self.graph.successors(node)
+
+    def nodes(self):
+        return [('view', view_name) for view_name in self.views] + [('explore', explore_name) for explore_name in self.explores]
+
+    def predecessors(self, node):
+        if self._predecessors is None:
+            self._predecessors = lookml_parser.reverse_adjacency(self.nodes(), self.successors)
+        return self._predecessors.get(node, [])
+
+    def walk(self, node, direction, depth=None):
+        '''breadth-first (node, distance) pairs upstream (what node depends on) or downstream (what depends on node)'''
+        neighbours = self.successors if direction == 'upstream' else self.predecessors
+        seen = {node}
+        found = []
+        frontier = [node]
+        distance = 0
+        while frontier and (depth is None or distance < depth):
+            distance += 1
+            next_frontier = []
+            for current in frontier:
+                for neighbour in neighbours(current):
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        found.append((neighbour, distance))
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return found
+
+    def describe(self, node, distance=None):
+        node_type, node_name = node
+        info = {'node': node_type + ':' + node_name, 'type': node_type, 'name': node_name}
+        if distance is not None:
+            info['depth'] = distance
+        if node_type == 'view' and node_name in self.views:
+            info['file'] = self.views[node_name]['file']
+        elif node_type == 'explore' and node_name in self.explores:
+            info['file'] = self.explores[node_name]['file']
+            info['is_endpoint'] = self.explores[node_name]['is_endpoint']
+        return info
+
+    def impact(self, node, depth=None):
+        '''everything downstream of node, with the endpoint explores and files that would need checking'''
+        downstream = [self.describe(found, distance) for found, distance in self.walk(node, 'downstream', depth)]
+        return {
+            'node': self.describe(node),
+            'downstream': downstream,
+            'endpoint_explores': [info['name'] for info in downstream if info.get('is_endpoint')],
+            'files': sorted({info['file'] for info in downstream if 'file' in info}),
+        }
+
+class FieldIndex(LineageIndex):
+    '''upstream of a field are the columns and fields it reads, downstream the fields that read it'''
+    def __init__(self, columns, fields, views, explores):
+        self.columns = columns
+        self.fields = fields
+        self.views = views
+        self.explores = explores
+        self._predecessors = None
+
+    @classmethod
+    def load(cls, index_file=lookml_parser.FIELD_INDEX_FILE):
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        if index.get('version') != lookml_parser.FIELD_INDEX_VERSION:
+            raise ValueError(index_file + ' was written by another version of lookml_parser.py; rerun the parser')
+        return cls(index['columns'], index['fields'], index['views'], index['explores'])
+
+    def resolve(self, name):
+        '''accepts field:view.field or column:table.column, or a bare name that is looked up as a field, then a column'''
+        node_type, _, node_name = name.partition(':')
+        if node_name and node_type in FIELD_NODE_TYPES:
+            return node_type, node_name
+        if name in self.fields:
+            return 'field', name
+        return 'column', name
+
+    def successors(self, node):
+        if node[0] == 'field' and node[1] in self.fields:
+            field = self.fields[node[1]]
+            return [('column', column) for column in field['columns']] + [('field', field_id) for field_id in field['references']]
+        return []
+
+    def nodes(self):
+        return [('field', field_id) for field_id in self.fields]
+
+    def describe(self, node, distance=None):
+        node_type, node_name = node
+        info = {'node': node_type + ':' + node_name, 'type': node_type, 'name': node_name}
+        if distance is not None:
+            info['depth'] = distance
+        if node_type == 'field' and node_name in self.fields:
+            info['view'] = self.fields[node_name]['view']
+            if self.fields[node_name]['file'] is not None:
+                info['file'] = self.fields[node_name]['file']
+        return info
+
+    def impact(self, node, depth=None):
+        '''the fields that read node, the views that define them, and the explores that read those views or join on them'''
+        downstream = [self.describe(found, distance) for found, distance in self.walk(node, 'downstream', depth)]
+        field_ids = [info['name'] for info in downstream if info['type'] == 'field']
+        if node[0] == 'field':
+            field_ids.insert(0, node[1])
+        view_names = list(dict.fromkeys(self.fields[field_id]['view'] for field_id in field_ids if field_id in self.fields))
+        sql_on = [dict(join, field=field_id) for field_id in field_ids if field_id in self.fields for join in self.fields[field_id]['sql_on']]
+        explore_names = list(dict.fromkeys([explore_name for view_name in view_names for explore_name in self.views.get(view_name, {}).get('explores', [])] + [join['explore'] for join in sql_on]))
+        return {
+            'node': self.describe(node),
+            'downstream': downstream,
+            'views': view_names,
+            'explores': explore_names,
+            'sql_on': sql_on,
+            'endpoint_explores': [explore_name for explore_name in explore_names if self.explores.get(explore_name, {}).get('is_endpoint')],
+            'files': sorted({info['file'] for info in [self.describe(node)] + downstream if 'file' in info} | {join['file'] for join in sql_on} | {self.explores[explore_name]['file'] for explore_name in explore_names if explore_name in self.explores}),
+        }
+
+def run_query(index, command, node, depth=None):
+    if command == 'impact':
+        return index.impact(node, depth)
+    return {
+        'node': index.describe(node),
+        command: [index.describe(found, distance) for found, distance in index.walk(node, command, depth)],
+    }
+
+def format_text(command, result):
+    lines = [result['node']['node']]
+    listing = result['downstream'] if command == 'impact' else result[command]
+    for info in listing:
+        line = '  ' * info['depth'] + info['node']
+        if 'file' in info:
+            line += '  (' + info['file'] + ')'
+        if info.get('is_endpoint'):
+            line += '  [endpoint]'
+        lines.append(line)
+    if command == 'impact':
+        if 'views' in result:
+            lines.append('views: ' + ', '.join(result['views']))
+            lines.append('explores: ' + ', '.join(result['explores']))
+            lines.extend('sql_on: ' + join['explore'] + '.' + join['join'] + ' uses ' + join['field'] for join in result['sql_on'])
+        lines.append('endpoint explores: ' + ', '.join(result['endpoint_explores']))
+        lines.append('files: ' + ', '.join(result['files']))
+    return '\n'.join(lines) + '\n'
+
+def main():
+    args = parse_args()
+    if args.node.partition(':')[0] in FIELD_NODE_TYPES:
+        index_class, default_index = FieldIndex, lookml_parser.FIELD_INDEX_FILE
+    else:
+        index_class, default_index = LineageIndex, lookml_parser.LINEAGE_INDEX_FILE
+    index_file = args.index or os.path.join(args.wd, default_index)
+    if not os.path.exists(index_file):
+        hint = ' (run lookml_parser.py with --field-index)' if index_class is FieldIndex else ' (run lookml_parser.py first)'
+        sys.exit(index_file + ' not found' + hint)
+    index = index_class.load(index_file)
+    node = index.resolve(args.node)
+    result = run_query(index, args.command, node, args.depth)
+
+    if args.format == 'json':
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        sys.stdout.write(format_text(args.command, result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import os, shutil, subprocess, tempfile, time, types, unittest
+from unittest import mock
+
+import lookml_git_diff, lookml_parser
+
+'''
+Regression checks for lookml_parser.py: python -m unittest test_lookml_parser
+'''
+
+class LexerTest(unittest.TestCase):
+    def test_sql_always_filter_block_keeps_following_joins(self):
+        ml = (
+            'explore: orders {\n'
+            '  sql_always_filter: {\n'
+            '    filters: [orders.status: "complete"]\n'
+            '  }\n'
+            '  join: users {\n'
+            '    sql_on: ${orders.user_id} = ${users.id} ;;\n'
+            '  }\n'
+            '  join: products {\n'
+            '    sql_on: ${orders.product_id} = ${products.id} ;;\n'
+            '  }\n'
+            '}\n'
+        )
+        explores_info = lookml_parser.get_explores('orders.model.lkml', 'model', ml)
+        self.assertEqual(explores_info[0]['view_sources'], ['users', 'products'])
+
+    def test_sql_value_opening_with_liquid_runs_to_semicolons(self):
+        ml = (
+            'explore: orders {\n'
+            '  sql_always_where: {% if orders.region._in_query %} ${orders.region} = \'EU\' {% else %} 1=1 {% endif %} ;;\n'
+            '  join: users {\n'
+            '    sql_on: ${orders.user_id} = ${users.id} ;;\n'
+            '  }\n'
+            '}\n'
+        )
+        explores_info = lookml_parser.get_explores('orders.model.lkml', 'model', ml)
+        self.assertEqual(explores_info[0]['view_sources'], ['users'])
+
+class PathIndexTest(unittest.TestCase):
+    def test_scan_does_not_follow_folder_symlinks(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, 'sub'))
+            with open(os.path.join(root, 'sub', 'users.view.lkml'), 'w') as f:
+                f.write('view: users {}\n')
+            os.symlink('..', os.path.join(root, 'sub', 'up'))
+            path_index = lookml_parser.PathIndex.scan(root)
+        self.assertEqual(path_index.view_files, ['sub/users.view.lkml'])
+
+    def test_double_star_in_last_segment_crosses_folders(self):
+        path_index = lookml_parser.PathIndex(['views/a.view.lkml', 'views/sub/b.view.lkml', 'models/shop.model.lkml'])
+        self.assertEqual(path_index.resolve('/views/**'), ['views/a.view.lkml', 'views/sub/b.view.lkml'])
+        self.assertEqual(path_index.resolve('/views/*.view'), ['views/a.view.lkml'])
+
+class ParseCacheTest(unittest.TestCase):
+    def test_file_changed_while_parsed_is_not_cached_as_current(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as root:
+            os.chdir(root)
+            try:
+                with open('users.view.lkml', 'w') as f:
+                    f.write('view: users {\n  sql_table_name: analytics.users ;;\n}\n')
+                return_ml = lookml_parser.return_ml
+
+                def edit_after_read(lookml_file):
+                    ml = return_ml(lookml_file)
+                    time.sleep(0.02)
+                    with open(lookml_file, 'w') as f:
+                        f.write(ml.replace('analytics.users ', 'analytics.users_v2 '))
+                    return ml
+
+                cache = {}
+                with mock.patch.object(lookml_parser, 'return_ml', edit_after_read):
+                    lookml_parser.parse_all_files(['users.view.lkml'], [], cache=cache)
+                views_info, _ = lookml_parser.parse_all_files(['users.view.lkml'], [], cache=cache)
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(views_info[0]['view_source_name'], 'analytics.users_v2')
+
+class MinimalIncludesTest(unittest.TestCase):
+    def reached(self, graph):
+        bit, reach, component_of = lookml_parser.reachability(list(graph), lambda node: graph[node])
+        return {node: {other for other in graph if reach[node] & bit[other]} for node in graph}, component_of
+
+    def test_reachability_of_chain_diamond_and_cycle(self):
+        reached, _ = self.reached({'a': ['b'], 'b': ['c'], 'c': []})
+        self.assertEqual(reached, {'a': {'b', 'c'}, 'b': {'c'}, 'c': set()})
+
+        reached, _ = self.reached({'a': ['b', 'c'], 'b': ['d'], 'c': ['d'], 'd': []})
+        self.assertEqual(reached, {'a': {'b', 'c', 'd'}, 'b': {'d'}, 'c': {'d'}, 'd': set()})
+
+        reached, component_of = self.reached({'a': ['b'], 'b': ['c'], 'c': ['b', 'd'], 'd': []})
+        self.assertEqual(reached, {'a': {'b', 'c', 'd'}, 'b': {'b', 'c', 'd'}, 'c': {'b', 'c', 'd'}, 'd': set()})
+        self.assertEqual(component_of['b'], component_of['c'])
+        self.assertNotEqual(component_of['a'], component_of['b'])
+
+    def test_minimal_include_rows(self):
+        files = ['m1.model.lkml', 'm2.model.lkml', 'm3.model.lkml', 'm4.model.lkml', 'v1.view.lkml', 'v2.view.lkml', 'v3.view.lkml', 'v4.view.lkml']
+        include_index = types.SimpleNamespace(
+            view_includes={'v1.view.lkml': ['m2.model.lkml'], 'v4.view.lkml': ['m4.model.lkml']},
+            model_includes={'m1.model.lkml': ['v1.view.lkml', 'v2.view.lkml'], 'm2.model.lkml': ['v2.view.lkml'], 'm3.model.lkml': ['v2.view.lkml', 'v3.view.lkml'], 'm4.model.lkml': ['v4.view.lkml']},
+            file_order={lookml_file: i for i, lookml_file in enumerate(files)},
+        )
+        includes = {
+            'm1.model.lkml': ['/v2.view'],
+            'm2.model.lkml': ['/v2.view'],
+            'm3.model.lkml': ['/v3.view'],
+            'm4.model.lkml': ['/v4.view'],
+            'v1.view.lkml': ['/m2.model'],
+            'v3.view.lkml': ['/v2.view'],
+            'v4.view.lkml': ['/m4.model'],
+        }
+        rows = [tuple(row.values()) for row in lookml_parser.minimal_include_rows(include_index, lookml_parser.PathIndex(files), includes)]
+        self.assertEqual(rows, [
+            ('m1.model.lkml', 'v1.view.lkml', 'missing', None),
+            ('m1.model.lkml', 'v2.view.lkml', 'redundant', 'v1.view.lkml'),
+            ('m2.model.lkml', 'v2.view.lkml', 'declared', None),
+            ('m3.model.lkml', 'v2.view.lkml', 'transitive', 'v3.view.lkml'),
+            ('m3.model.lkml', 'v3.view.lkml', 'declared', None),
+            ('m4.model.lkml', 'v4.view.lkml', 'declared', None),
+            ('v1.view.lkml', 'm2.model.lkml', 'declared', None),
+            ('v3.view.lkml', 'v2.view.lkml', 'redundant', None),
+            ('v4.view.lkml', 'm4.model.lkml', 'declared', None),
+        ])
+
+@unittest.skipUnless(shutil.which('git'), 'needs git')
+class GitDiffTest(unittest.TestCase):
+    def commit(self, repository, files):
+        for lookml_file, ml in files.items():
+            path = os.path.join(repository, lookml_file)
+            if ml is None:
+                os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(ml)
+        subprocess.run(['git', '-C', repository, 'add', '-A'], check=True)
+        subprocess.run(['git', '-C', repository, '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', 'revision'], check=True)
+
+    def test_diff_of_two_revisions(self):
+        with tempfile.TemporaryDirectory() as repository:
+            subprocess.run(['git', 'init', '-q', repository], check=True)
+            self.commit(repository, {
+                'lookml/views/orders.view.lkml': 'view: orders {\n  sql_table_name: analytics.orders ;;\n}\n',
+                'lookml/views/users.view.lkml': 'view: users {\n  sql_table_name: analytics.users ;;\n}\n',
+                'lookml/shop.model.lkml': 'include: "/views/*.view"\nexplore: orders {\n  join: users {}\n}\n',
+            })
+            self.commit(repository, {
+                'lookml/views/users.view.lkml': None,
+                'lookml/views/customers.view.lkml': 'view: customers {\n  sql_table_name: analytics.customers ;;\n}\n',
+                'lookml/shop.model.lkml': 'include: "/views/*.view"\nexplore: orders {\n  join: customers {}\n}\n',
+            })
+            diff = lookml_git_diff.git_diff(repository, 'HEAD~1', 'HEAD', 'lookml')
+            repeated = lookml_git_diff.git_diff(repository, 'HEAD~1', 'HEAD', 'lookml')
+
+        self.assertEqual(diff['files'], {'added': ['views/customers.view.lkml'], 'removed': ['views/users.view.lkml'], 'modified': ['shop.model.lkml']})
+        self.assertEqual([row['view_name'] for row in diff['views']['added']], ['customers'])
+        self.assertEqual([row['view_name'] for row in diff['views']['removed']], ['users'])
+        self.assertEqual(diff['edges'], {'added': [['explore:orders', 'view:customers']], 'removed': [['explore:orders', 'view:users']]})
+        self.assertEqual([(row['file_location'], row['include_file_location']) for row in diff['includes']['added']], [('shop.model.lkml', 'views/customers.view.lkml')])
+        self.assertEqual([(row['file_location'], row['include_file_location']) for row in diff['includes']['removed']], [('shop.model.lkml', 'views/users.view.lkml')])
+        self.assertEqual(diff['blobs'], {'cached': 0, 'parsed': 5, 'shared': 1})
+        self.assertEqual(repeated['blobs'], {'cached': 5, 'parsed': 0, 'shared': 1})
+        self.assertEqual(repeated['edges'], diff['edges'])
+
+if __name__ == "__main__":
+    unittest.main()